@@ -1,15 +1,17 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import admin  # after other imports
-app.include_router(admin.router)
 
 # ✅ Works on Railway AND locally
 try:
     from .db import init_db
-    from .routers import meta, seed, solve
+    from .routers import admin, export, meta, seed, solve
+    from . import jobs, metrics
 except ImportError:
     from db import init_db
-    from routers import meta, seed, solve
+    from routers import admin, export, meta, seed, solve
+    import jobs
+    import metrics
 
 app = FastAPI(title="Temporis Timetable API")
 
@@ -24,10 +26,20 @@ app.add_middleware(
 def startup():
     init_db()
 
+@app.on_event("shutdown")
+def shutdown():
+    jobs.shutdown()
+
+app.include_router(admin.router)
 app.include_router(seed.router)
 app.include_router(meta.router)
 app.include_router(solve.router)
+app.include_router(export.router)
 
 @app.get("/")
 def root():
     return {"ok": True, "service": "temporis"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
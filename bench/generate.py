@@ -0,0 +1,73 @@
+import random
+from sqlmodel import delete
+try:
+    from ..models import Teacher, Subject, ClassGroup, Room, Timeslot, ClassSubject, Assignment, Timetable, TimetableGrid
+except ImportError:
+    from models import Teacher, Subject, ClassGroup, Room, Timeslot, ClassSubject, Assignment, Timetable, TimetableGrid
+
+# Seeded synthetic institutions.  The same parameters and seed always give the
+# same rows, ids included.  Every class gets about density x (days x periods)
+# sessions a week: one lab subject plus theory subjects of 2-5 hours drawn
+# from a shared catalog, each taught by the least loaded teacher.  The presets leave enough rooms and
+# teacher hours to be feasible.
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+
+PRESETS = {
+    "small": dict(classes=6, teachers=10, rooms=6, labs=2, days=5, periods=6, density=0.6),
+    "medium": dict(classes=24, teachers=36, rooms=24, labs=6, days=5, periods=7, density=0.6),
+    "large": dict(classes=60, teachers=90, rooms=60, labs=14, days=6, periods=8, density=0.6),
+}
+
+
+def generate(classes, teachers, rooms, labs=2, days=5, periods=6, density=0.6, lab_hours=2, seed=0) -> dict:
+    # -> {"teachers": [...], "subjects": [...], ...} lists of unsaved model rows
+    if not 1 <= days <= len(DAYS):
+        raise ValueError(f"days must be between 1 and {len(DAYS)}")
+    if not 0 < density <= 1:
+        raise ValueError("density must be in (0, 1]")
+    rnd = random.Random(seed)
+    slots = [Timeslot(id=d * periods + p + 1, day=DAYS[d], slot_index=p + 1,
+                      start_time=f"{8 + p:02d}:00", end_time=f"{9 + p:02d}:00")
+             for d in range(days) for p in range(periods)]
+    teacher_rows = [Teacher(id=i, name=f"Teacher {i}", code=f"T{i:04d}", max_daily_load=periods)
+                    for i in range(1, teachers + 1)]
+    room_rows = [Room(id=i, name=f"R{i:03d}", capacity=60, type="theory") for i in range(1, rooms + 1)]
+    room_rows += [Room(id=rooms + i, name=f"LAB{i:02d}", capacity=60, type="lab") for i in range(1, labs + 1)]
+    class_rows = [ClassGroup(id=i, name=f"Class {i}", size=rnd.randint(25, 60)) for i in range(1, classes + 1)]
+
+    # a shared catalog, so most subjects are taught to several classes
+    theory = [Subject(id=i, name=f"Theory {i}", code=f"S{i:04d}", type="theory", hours_per_week=rnd.randint(2, 5))
+              for i in range(1, classes // 2 + 9)]
+    lab = [Subject(id=len(theory) + i, name=f"Lab {i}", code=f"L{i:04d}", type="lab", hours_per_week=lab_hours)
+           for i in range(1, max(1, classes // 8) + 1)] if labs else []
+
+    weekly = max(1, round(density * days * periods))
+    load = {t.id: 0 for t in teacher_rows}
+    maps = []
+    for cl in class_rows:
+        plan = []
+        if lab and lab_hours < weekly:
+            plan.append((rnd.choice(lab), lab_hours))
+        left = weekly - lab_hours * len(plan)
+        for sub in rnd.sample(theory, len(theory)):
+            if left <= 0:
+                break
+            plan.append((sub, min(sub.hours_per_week, left)))
+            left -= sub.hours_per_week
+        for sub, hours in plan:
+            teacher_id = min(load, key=lambda t: (load[t], rnd.random()))
+            load[teacher_id] += hours
+            maps.append(ClassSubject(id=len(maps) + 1, class_id=cl.id, subject_id=sub.id, teacher_id=teacher_id,
+                                     required_hours=hours if hours != sub.hours_per_week else None))
+    return {"teachers": teacher_rows, "subjects": theory + lab, "classes": class_rows, "rooms": room_rows,
+            "timeslots": slots, "maps": maps}
+
+
+def load_instance(s, instance):
+    # replaces every row in the database with the instance; the caller commits
+    for model in (TimetableGrid, Assignment, Timetable, ClassSubject, Timeslot, Room, ClassGroup, Subject, Teacher):
+        s.exec(delete(model))
+    for name in ("teachers", "subjects", "classes", "rooms", "timeslots", "maps"):
+        s.add_all(instance[name])
+        s.flush()
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Solver benchmark: generates each preset instance, then times the phases of
+# a solve one by one (context load, variables, domains, neighbors for the
+# classic engine, root propagation, engine construction, search,
+# persistence) and records search nodes and the peak memory of build+search.
+# Results are compared against a stored baseline; more nodes or memory than
+# the baseline by more than the tolerance, or losing a timetable, is
+# reported as a regression and the exit status is 1.  Nodes and memory are
+# the same on every machine; wall-clock times are only comparable with a
+# baseline recorded on the same one, so they are gated with --check-time.
+#
+#   python -m bench.run                       # small and medium vs bench/baseline.json
+#   python -m bench.run --sizes large --engine classic
+#   python -m bench.run --check-time          # also fail on slower phases
+#   python -m bench.run --update              # rewrite the baseline
+#
+# Runs against its own temporary SQLite database unless BENCH_DB_URL is set;
+# the database is wiped for every instance.
+
+os.environ["DB_URL"] = os.getenv("BENCH_DB_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+try:
+    from ..db import init_db, get_session
+    from ..solver.build_problem import load_context, build_variables, build_domains, build_neighbors, Rules
+    from ..solver.pipeline import make_csp, persist_assignment
+    from ..solver.propagate import reduce
+    from .generate import PRESETS, generate, load_instance
+except ImportError:
+    from db import init_db, get_session
+    from solver.build_problem import load_context, build_variables, build_domains, build_neighbors, Rules
+    from solver.pipeline import make_csp, persist_assignment
+    from solver.propagate import reduce
+    from bench.generate import PRESETS, generate, load_instance
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PHASES = ("load", "variables", "domains", "neighbors", "propagate", "engine", "search", "persist")
+# timings below this many seconds are noise, whatever the ratio
+MIN_SECONDS = 0.05
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def run_case(params, seed=0, engine="bitset", value_order="lcv", repeat=1, memory=True) -> dict:
+    with get_session() as s:
+        load_instance(s, generate(seed=seed, **params))
+        s.commit()
+    best = {}
+    for _ in range(repeat):
+        t = {}
+        ctx, t["load"] = _timed(load_context)
+        variables, t["variables"] = _timed(build_variables, ctx)
+        domains, t["domains"] = _timed(build_domains, ctx, variables)
+        if engine == "classic":  # the only engine that builds a neighbor graph
+            _, t["neighbors"] = _timed(build_neighbors, variables, domains)
+        (domains, _), t["propagate"] = _timed(reduce, variables, domains, Rules(ctx))
+        csp, t["engine"] = _timed(make_csp, engine, value_order, ctx, variables, domains)
+        assignment, t["search"] = _timed(csp.backtrack)
+        if assignment:
+            _, t["persist"] = _timed(persist_assignment, assignment)
+        best = {p: min(t[p], best.get(p, t[p])) for p in t}
+    out = {
+        "sessions": len(variables),
+        "feasible": bool(assignment),
+        "nodes": csp.nodes,
+        "seconds": {p: round(best[p], 4) for p in PHASES if p in best},
+    }
+    if memory:
+        tracemalloc.start()
+        ctx = load_context()
+        variables = build_variables(ctx)
+        domains, _ = reduce(variables, build_domains(ctx, variables), Rules(ctx))
+        make_csp(engine, value_order, ctx, variables, domains).backtrack()
+        out["peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return out
+
+
+def compare(results, baseline, tolerance, check_time=False) -> list:
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for phase, seconds in res["seconds"].items() if check_time else ():
+            was = base["seconds"].get(phase)
+            if was is not None and seconds > was * (1 + tolerance) and seconds - was > MIN_SECONDS:
+                regressions.append(f"{name}: {phase} {was:.3f}s -> {seconds:.3f}s")
+        if res["nodes"] > base["nodes"] * (1 + tolerance):
+            regressions.append(f"{name}: nodes {base['nodes']} -> {res['nodes']}")
+        if "peak_kib" in res and "peak_kib" in base and res["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {base['peak_kib']} KiB -> {res['peak_kib']} KiB")
+        if base.get("feasible") and not res["feasible"]:
+            regressions.append(f"{name}: no longer finds a timetable")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Time each solve phase on generated instances and compare the "
+                                             "results with a stored baseline.")
+    ap.add_argument("--sizes", default="small,medium", help=f"comma list of {', '.join(PRESETS)}")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--engine", default="bitset")
+    ap.add_argument("--value-order", default="lcv")
+    ap.add_argument("--repeat", type=int, default=1, help="runs per size; the fastest time of each phase counts")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--check-time", action="store_true",
+                    help="also gate on phase times; only meaningful against a baseline from this machine")
+    ap.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args(argv)
+
+    sizes = [x.strip() for x in args.sizes.split(",") if x.strip()]
+    unknown = [x for x in sizes if x not in PRESETS]
+    if unknown:
+        ap.error(f"unknown sizes: {', '.join(unknown)}")
+
+    init_db()
+    results = {}
+    for name in sizes:
+        key = f"{name}/{args.engine}/{args.value_order}/seed={args.seed}"
+        results[key] = res = run_case(PRESETS[name], args.seed, args.engine, args.value_order,
+                                      args.repeat, not args.no_memory)
+        if not args.json:
+            phases = "  ".join(f"{p}={s:.3f}" for p, s in res["seconds"].items())
+            mem = f"  peak={res['peak_kib']}KiB" if "peak_kib" in res else ""
+            print(f"{key}: {res['sessions']} sessions, {res['nodes']} nodes  {phases}{mem}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.update:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.check_time)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
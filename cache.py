@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+# In-process cache of encoded read responses (/meta, /meta/timetable).
+# Writers call invalidate() after they commit (admin, seed, solve persistence,
+# switching the active timetable), which drops every entry.  Other API
+# processes cannot see that call, so entries also expire after CACHE_TTL
+# seconds.  ETags are a hash of the body, so they agree across processes and
+# survive invalidations that did not change the data.
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+_entries = OrderedDict()  # key -> (stored_at, body, etag)
+_lock = threading.Lock()
+_generation = 0
+
+
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+
+
+def get(key, build):
+    # -> (body bytes, etag); build() runs outside the lock on a miss
+    now = time.monotonic()
+    with _lock:
+        hit = _entries.get(key)
+        if hit is not None and now - hit[0] < CACHE_TTL:
+            _entries.move_to_end(key)
+            return hit[1], hit[2]
+        generation = _generation
+    body = json.dumps(jsonable_encoder(build()), separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    with _lock:
+        # don't store data built before an invalidation that raced with us
+        if generation == _generation:
+            _entries[key] = (now, body, etag)
+            _entries.move_to_end(key)
+            while len(_entries) > CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return body, etag
+
+
+def json_response(key, build, if_none_match=None) -> Response:
+    body, etag = get(key, build)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,12 +1,77 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 import os
 
 DB_URL = os.getenv("DB_URL", "sqlite:///timetable.db")
-engine = create_engine(DB_URL, echo=False)
+
+# SQLite: WAL lets readers keep going while a solve writes its timetable;
+# synchronous=NORMAL is safe with WAL and skips an fsync per commit.  The
+# cache size is in KiB when negative, as in SQLite's own pragma.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# server databases (Postgres, MySQL): connections kept open and extra ones allowed under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def make_engine(url):
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                             pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+    # sessions are handed between FastAPI's worker threads
+    eng = create_engine(url, echo=False, connect_args={"check_same_thread": False})
+    in_memory = url.database in (None, "", ":memory:")
+
+    @event.listens_for(eng, "connect")
+    def _pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if not in_memory:
+            cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.close()
+    return eng
+
+engine = make_engine(DB_URL)
 
 def init_db():
     import models  # ✅ works as top-level
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    add_missing_indexes()
+
+def add_missing_columns():
+    # create_all() never alters existing tables; add new nullable columns so
+    # databases created by older versions keep working
+    existing = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not existing.has_table(table.name):
+                continue
+            have = {c["name"] for c in existing.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have and col.nullable:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+
+def add_missing_indexes():
+    # likewise for indexes declared after a table was first created
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def get_session():
     return Session(engine)
+
+def session_scope():
+    # FastAPI dependency: one session per request, closed after the response.
+    # Sessions connect lazily, so requests answered from the cache never
+    # check out a connection.
+    with Session(engine) as s:
+        yield s
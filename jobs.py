@@ -0,0 +1,252 @@
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from . import metrics
+    from .solver.pipeline import solve_problem, save_result
+except ImportError:
+    import metrics
+    from solver.pipeline import solve_problem, save_result
+
+# Background solve jobs.  Each job runs solve_problem in its own worker
+# process so a hard instance can be stopped at its deadline or cancelled by
+# terminating the process; at most SOLVE_WORKERS run at once and the rest
+# wait in FIFO order.  Results are persisted here in the API process, one
+# job at a time, on a thread of their own so that writing a large timetable
+# does not hold up the manager loop (progress, deadlines, starting jobs).
+#
+# A time_limit given with the job is passed on to the solver, which stops on
+# its own at that point and returns its best partial timetable.  Without one
+# the solve runs as a plain full solve (infeasible inputs fail at once).
+# Either way the process is killed when it runs STOP_GRACE seconds past the
+# job's deadline: its time_limit, at most SOLVE_TIME_LIMIT.
+
+SOLVE_WORKERS = int(os.getenv("SOLVE_WORKERS", "2"))
+SOLVE_TIME_LIMIT = float(os.getenv("SOLVE_TIME_LIMIT", "300"))  # seconds, also the per-job maximum
+KEEP_FINISHED_JOBS = int(os.getenv("KEEP_FINISHED_JOBS", "100"))
+STOP_GRACE = 10.0
+
+FINISHED = ("done", "failed", "cancelled", "timeout")
+
+_ctx = mp.get_context("spawn")
+
+
+def _worker(conn, options):
+    # exit normally on terminate() so portfolio/decompose children are reaped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    try:
+        def progress(phase):
+            conn.send(("progress", phase))
+        conn.send(("result", solve_problem(progress=progress, **options)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class Job:
+    def __init__(self, options, time_limit):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.time_limit = time_limit
+        self.status = "queued"
+        self.phase = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.process = None
+        self.conn = None
+
+    def info(self):
+        now = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "options": self.options,
+            "time_limit": self.time_limit,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": round(now - self.started_at, 3) if self.started_at else 0.0,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    def __init__(self, workers=SOLVE_WORKERS, max_time_limit=SOLVE_TIME_LIMIT):
+        self.workers = max(1, workers)
+        self.max_time_limit = max_time_limit
+        self.jobs = OrderedDict()
+        self.pending = deque()
+        self.running = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.persister = ThreadPoolExecutor(max_workers=1, thread_name_prefix="solve-persist")
+        self.thread = threading.Thread(target=self._loop, name="solve-jobs", daemon=True)
+        self.thread.start()
+
+    def submit(self, options, time_limit=None) -> Job:
+        limit = self.max_time_limit if time_limit is None else min(time_limit, self.max_time_limit)
+        if time_limit is not None:
+            options = dict(options, time_limit=limit)
+        job = Job(options, limit)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self._forget_old()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        exited = []
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED or job.status == "persisting":
+                return job
+            if job.status == "queued":
+                self.pending.remove(job)
+            else:
+                self._stop(job, exited)
+            self._finish(job, "cancelled")
+        _reap(exited)
+        return job
+
+    def shutdown(self):
+        self.stopped.set()
+        self.thread.join(timeout=5)
+        self.persister.shutdown(wait=True)
+        exited = []
+        with self.lock:
+            for job in list(self.running):
+                self._stop(job, exited)
+                self._finish(job, "cancelled")
+            while self.pending:
+                self._finish(self.pending.popleft(), "cancelled")
+        _reap(exited)
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            done, exited = [], []
+            with self.lock:
+                now = time.time()
+                for job in list(self.running):
+                    self._drain(job, done, exited)
+                    if job.status == "running" and now - job.started_at > job.time_limit + STOP_GRACE:
+                        self._stop(job, exited)
+                        self._finish(job, "timeout")
+                        job.error = f"exceeded time limit of {job.time_limit}s"
+                while self.pending and len(self.running) < self.workers:
+                    self._start(self.pending.popleft())
+            _reap(exited)
+            for job, result in done:
+                self.persister.submit(self._persist, job, result)
+            self.stopped.wait(0.05)
+
+    def _start(self, job):
+        parent, child = _ctx.Pipe(duplex=False)
+        # not a daemon: a decomposed solve starts its own pool of workers
+        job.process = _ctx.Process(target=_worker, args=(child, job.options))
+        job.process.start()
+        child.close()
+        job.conn = parent
+        job.status = "running"
+        job.started_at = time.time()
+        self.running.append(job)
+
+    def _drain(self, job, done, exited):
+        try:
+            while job.conn.poll():
+                kind, payload = job.conn.recv()
+                if kind == "progress":
+                    job.phase = payload
+                elif kind == "result":
+                    job.status = "persisting"
+                    job.phase = "persist"
+                    self._release(job, exited)
+                    done.append((job, payload))
+                    return
+                else:
+                    self._release(job, exited)
+                    self._finish(job, "failed")
+                    job.error = payload
+                    return
+        except (EOFError, OSError):
+            self._release(job, exited)
+            self._finish(job, "failed")
+            job.error = "worker process exited unexpectedly"
+
+    def _persist(self, job, result):
+        try:
+            result.update(save_result(result))
+        except Exception as e:
+            with self.lock:
+                self._finish(job, "failed")
+                job.error = f"{type(e).__name__}: {e}"
+            return
+        metrics.record_solve(result)
+        with self.lock:
+            if job.status == "persisting":
+                job.result = result
+                self._finish(job, "done")
+
+    def _stop(self, job, exited):
+        if job.process is not None and job.process.is_alive():
+            job.process.terminate()
+        self._release(job, exited)
+
+    def _release(self, job, exited):
+        # called with the lock held: the worker goes to exited and is joined
+        # by the caller after releasing it, so status/cancel/submit never wait
+        # on a process to exit
+        if job in self.running:
+            self.running.remove(job)
+        if job.conn is not None:
+            job.conn.close()
+            job.conn = None
+        if job.process is not None:
+            exited.append(job.process)
+            job.process = None
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        metrics.inc("temporis_solve_jobs_total", status=status)
+
+    def _forget_old(self):
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+
+def _reap(processes):
+    for process in processes:
+        process.join(timeout=1)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+def shutdown():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
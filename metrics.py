@@ -0,0 +1,110 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+
+# Solver metrics in the Prometheus text format, served on /metrics.
+# Counters and histograms are cumulative since the API process started and
+# are fed from finished solve results (sync /solve and background jobs), so
+# they only cover solves that ran through this process.
+
+PHASE_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# write a .prof file per profiled solve here (for snakeviz/pstats) if set
+SOLVE_PROFILE_DIR = os.getenv("SOLVE_PROFILE_DIR")
+PROFILE_TOP = 30
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+_HELP = {
+    "temporis_solves_total": ("counter", "Finished solves by result status."),
+    "temporis_solve_jobs_total": ("counter", "Background solve jobs by final status."),
+    "temporis_search_nodes_total": ("counter", "Values tried by the search."),
+    "temporis_search_backtracks_total": ("counter", "Search frames exhausted."),
+    "temporis_search_pruned_total": ("counter", "Values removed by forward checking."),
+    "temporis_solve_cache_hits_total": ("counter", "Solves answered from the compiled problem or solution cache."),
+    "temporis_search_max_depth": ("histogram", "Deepest search stack per solve."),
+    "temporis_solve_phase_seconds": ("histogram", "Wall time per solve phase."),
+}
+_DEPTH_BUCKETS = (10, 100, 1000, 10000, 100000)
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=PHASE_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+        for j, bound in enumerate(buckets):
+            if value <= bound:
+                h[1][j] += 1
+        h[1][-1] += 1
+        h[2] += value
+
+
+def record_solve(result):
+    inc("temporis_solves_total", status=result.get("status", "unknown"))
+    for kind, hit in (result.get("cache") or {}).items():
+        if hit:
+            inc("temporis_solve_cache_hits_total", kind=kind)
+    stats = result.get("search")
+    if stats:
+        inc("temporis_search_nodes_total", stats["nodes"])
+        inc("temporis_search_backtracks_total", stats["backtracks"])
+        inc("temporis_search_pruned_total", stats["pruned"])
+        observe("temporis_search_max_depth", stats["max_depth"], buckets=_DEPTH_BUCKETS)
+    for phase, seconds in (result.get("timings") or {}).items():
+        observe("temporis_solve_phase_seconds", seconds, phase=phase)
+
+
+def render() -> str:
+    def fmt(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    lines = []
+    with _lock:
+        names = sorted({n for n, _ in _counters} | {n for n, _ in _histograms})
+        for name in names:
+            kind, text = _HELP.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (n, labels), value in sorted(_counters.items()):
+                if n == name:
+                    lines.append(f"{name}{fmt(labels)} {value}")
+            for (n, labels), (buckets, counts, total) in sorted(_histograms.items()):
+                if n != name:
+                    continue
+                for bound, count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {counts[-1]}")
+                lines.append(f"{name}_sum{fmt(labels)} {round(total, 6)}")
+                lines.append(f"{name}_count{fmt(labels)} {counts[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def profile_call(fn, *args, **kwargs):
+    # Run fn under cProfile -> (result, {"top": text, "file": path or None}).
+    # Only this process is profiled: parallel components and portfolio runs
+    # show up as time spent waiting on their workers.
+    prof = cProfile.Profile()
+    result = prof.runcall(fn, *args, **kwargs)
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    path = None
+    if SOLVE_PROFILE_DIR:
+        os.makedirs(SOLVE_PROFILE_DIR, exist_ok=True)
+        path = os.path.join(SOLVE_PROFILE_DIR, f"solve-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        prof.dump_stats(path)
+    return result, {"top": out.getvalue(), "file": path}
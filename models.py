@@ -1,7 +1,8 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timezone
+from sqlalchemy import Index
 
 
 class RoomType(str, Enum):
@@ -61,12 +62,39 @@ class ClassSubject(SQLModel, table=True):
     required_hours: Optional[int] = None
 
 
+class Timetable(SQLModel, table=True):
+    # one saved solve; readers only see the assignments of the active one
+    id: Optional[int] = Field(default=None, primary_key=True)
+    status: str = "feasible"
+    sessions: int = 0
+    is_active: bool = False
+    fingerprint: Optional[str] = None  # input data + solve options that produced it
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class Assignment(SQLModel, table=True):
+    # every read filters on the timetable version first, then one entity
+    __table_args__ = (
+        Index("ix_assignment_timetable_class", "timetable_id", "class_id"),
+        Index("ix_assignment_timetable_teacher", "timetable_id", "teacher_id"),
+        Index("ix_assignment_timetable_room", "timetable_id", "room_id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
+    timetable_id: Optional[int] = Field(default=None, foreign_key="timetable.id")
     class_id: int = Field(foreign_key="classgroup.id")
     subject_id: int = Field(foreign_key="subject.id")
     teacher_id: int = Field(foreign_key="teacher.id")
     room_id: int = Field(foreign_key="room.id")
     timeslot_id: int = Field(foreign_key="timeslot.id")
     is_double: bool = False
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class TimetableGrid(SQLModel, table=True):
+    # day x period grid of one class, teacher or room, rendered at save time
+    __table_args__ = (Index("ix_timetablegrid_lookup", "timetable_id", "view", "entity_id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    timetable_id: int = Field(foreign_key="timetable.id")
+    view: str
+    entity_id: int
+    grid_json: str
@@ -0,0 +1,199 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+try:
+    from ..db import get_session, session_scope
+    from ..models import Teacher, Subject, ClassGroup, Room, Timeslot, Assignment, Timetable
+    from ..solver.pipeline import active_timetable_id
+except ImportError:
+    from db import get_session, session_scope
+    from models import Teacher, Subject, ClassGroup, Room, Timeslot, Assignment, Timetable
+    from solver.pipeline import active_timetable_id
+from sqlmodel import Session, select
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+# Bulk exports of a whole timetable (default: the active one).  Each export
+# is one joined query read through a server-side cursor in batches of
+# EXPORT_BATCH rows and written out batch by batch, so memory stays the same
+# however many assignments there are.  Exports bypass the response cache.
+#
+#   /export/assignments.csv     one row per period, names joined in
+#   /export/assignments.ndjson  the same rows as JSON Lines
+#   /export/teachers.ics        one VCALENDAR per teacher (or ?teacher_id=),
+#                               weekly recurring events from the week of
+#                               ?week= (default: this week); a double period
+#                               is a single event
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+
+COLUMNS = ("timetable_id", "assignment_id", "class_id", "class", "subject_id", "subject_code", "subject",
+           "teacher_id", "teacher_code", "teacher", "room_id", "room", "timeslot_id", "day", "slot_index",
+           "start_time", "end_time", "is_double")
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _query(tt_id, order):
+    q = (select(Assignment.timetable_id, Assignment.id, Assignment.class_id, ClassGroup.name,
+                Assignment.subject_id, Subject.code, Subject.name, Assignment.teacher_id, Teacher.code,
+                Teacher.name, Assignment.room_id, Room.name, Assignment.timeslot_id, Timeslot.day,
+                Timeslot.slot_index, Timeslot.start_time, Timeslot.end_time, Assignment.is_double)
+         .join(ClassGroup, ClassGroup.id == Assignment.class_id)
+         .join(Subject, Subject.id == Assignment.subject_id)
+         .join(Teacher, Teacher.id == Assignment.teacher_id)
+         .join(Room, Room.id == Assignment.room_id)
+         .join(Timeslot, Timeslot.id == Assignment.timeslot_id)
+         .where(Assignment.timetable_id == tt_id)
+         .order_by(*order, Assignment.timeslot_id, Assignment.id))
+    return q.execution_options(yield_per=EXPORT_BATCH)
+
+
+def _batches(q):
+    # rows in batches off one cursor; the session lives as long as the stream
+    with get_session() as s:
+        for rows in s.exec(q).partitions():
+            yield rows
+
+
+def _timetable(s, timetable_id):
+    if timetable_id is None:
+        return active_timetable_id(s)
+    if s.get(Timetable, timetable_id) is None:
+        raise HTTPException(status_code=404, detail="timetable not found")
+    return timetable_id
+
+
+def _stream(body, media_type, filename):
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/assignments.csv")
+def export_csv(timetable_id: int | None = None, s: Session = Depends(session_scope)):
+    q = _query(_timetable(s, timetable_id), (Assignment.class_id,))
+
+    def body():
+        buf = io.StringIO()
+        out = csv.writer(buf)
+        out.writerow(COLUMNS)
+        for rows in _batches(q):
+            out.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+    return _stream(body(), "text/csv; charset=utf-8", "assignments.csv")
+
+
+@router.get("/assignments.ndjson")
+def export_ndjson(timetable_id: int | None = None, s: Session = Depends(session_scope)):
+    q = _query(_timetable(s, timetable_id), (Assignment.class_id,))
+
+    def body():
+        for rows in _batches(q):
+            yield "".join(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows)
+    return _stream(body(), "application/x-ndjson", "assignments.ndjson")
+
+
+@router.get("/teachers.ics")
+def export_ics(timetable_id: int | None = None, teacher_id: int | None = None, week: date | None = None,
+               s: Session = Depends(session_scope)):
+    q = _query(_timetable(s, timetable_id), (Assignment.teacher_id,))
+    if teacher_id is not None:
+        if s.get(Teacher, teacher_id) is None:
+            raise HTTPException(status_code=404, detail="teacher not found")
+        q = q.where(Assignment.teacher_id == teacher_id)
+    week = week or date.today()
+    monday = week - timedelta(days=week.weekday())
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return _stream(_calendars(q, monday, stamp), "text/calendar; charset=utf-8", "teachers.ics")
+
+
+def _calendars(q, monday, stamp):
+    # rows ordered by teacher, then slot: a calendar opens at each new teacher
+    # and the two rows of a double period (adjacent in that order) merge
+    teacher, event = None, None
+    for rows in _batches(q):
+        lines = []
+        for row in rows:
+            r = dict(zip(COLUMNS, row))
+            if (event is not None and r["is_double"] and event["is_double"] and not event["merged"]
+                    and r["teacher_id"] == event["teacher_id"] and r["day"] == event["day"]
+                    and all(r[k] == event[k] for k in ("class_id", "subject_id", "room_id"))):
+                event["end_time"], event["merged"] = r["end_time"], True
+                continue
+            if event is not None:
+                lines += _vevent(event, monday, stamp)
+            if r["teacher_id"] != teacher:
+                if teacher is not None:
+                    lines.append("END:VCALENDAR")
+                lines += ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Temporis//Timetable export//EN",
+                          "CALSCALE:GREGORIAN", _fold("X-WR-CALNAME:" + _text(r["teacher"]))]
+                teacher = r["teacher_id"]
+            event = dict(r, merged=False)
+        yield "".join(line + "\r\n" for line in lines)
+    lines = []
+    if event is not None:
+        lines += _vevent(event, monday, stamp)
+    if teacher is not None:
+        lines.append("END:VCALENDAR")
+    yield "".join(line + "\r\n" for line in lines)
+
+
+def _vevent(e, monday, stamp):
+    day = e["day"][:3].lower()
+    if day not in WEEKDAYS:
+        return []  # a day name iCalendar cannot place in a week
+    on = (monday + timedelta(days=WEEKDAYS.index(day))).strftime("%Y%m%d")
+    start, end = _hhmmss(e["start_time"]), _hhmmss(e["end_time"])
+    if start and end:
+        when = [f"DTSTART:{on}T{start}", f"DTEND:{on}T{end}"]
+    else:
+        when = [f"DTSTART;VALUE=DATE:{on}"]  # no usable times: an all-day event
+    return [
+        "BEGIN:VEVENT",
+        f"UID:temporis-{e['timetable_id']}-{e['assignment_id']}@temporis",
+        f"DTSTAMP:{stamp}",
+        *when,
+        "RRULE:FREQ=WEEKLY",
+        _fold("SUMMARY:" + _text(f"{e['subject']} ({e['class']})")),
+        _fold("LOCATION:" + _text(e["room"])),
+        _fold("DESCRIPTION:" + _text(f"{e['subject_code']} {e['subject']}, class {e['class']}, "
+                                      f"teacher {e['teacher']}, room {e['room']}")),
+        "END:VEVENT",
+    ]
+
+
+def _hhmmss(t):
+    # "9:00" / "09:00" / "09:00:00" -> "090000"; None if it is not a time
+    try:
+        h, m, sec = (int(p) for p in (t.split(":") + ["0"])[:3])
+    except (AttributeError, ValueError):
+        return None
+    return f"{h:02d}{m:02d}{sec:02d}" if h < 24 and m < 60 and sec < 60 else None
+
+
+def _text(value):
+    # TEXT escaping (RFC 5545 3.3.11)
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line):
+    # content lines are at most 75 octets; continuations start with a space
+    raw = line.encode()
+    if len(raw) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(raw):
+        end = min(start + limit, len(raw))
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:  # keep UTF-8 sequences whole
+            end -= 1
+        parts.append(raw[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts)
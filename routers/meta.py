@@ -1,35 +1,87 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Header, HTTPException
 try:
-    from ..db import get_session
+    from .. import cache
+    from ..db import session_scope
     from ..models import Teacher, Subject, ClassGroup, Room, Timeslot, Assignment
+    from ..solver.pipeline import active_timetable_id
+    from ..solver.grids import VIEWS, load_grids
 except ImportError:
-    from db import get_session
+    import cache
+    from db import session_scope
     from models import Teacher, Subject, ClassGroup, Room, Timeslot, Assignment
-from sqlmodel import select
+    from solver.pipeline import active_timetable_id
+    from solver.grids import VIEWS, load_grids
+from sqlmodel import Session, select, func
 
 router = APIRouter(prefix="/meta", tags=["meta"])
 
+SECTIONS = {
+    "teachers": Teacher,
+    "subjects": Subject,
+    "classes": ClassGroup,
+    "rooms": Room,
+    "timeslots": Timeslot,
+}
+
+# Responses are served from the in-process cache with an ETag; send it back
+# in If-None-Match to get 304 Not Modified while nothing has changed.
+# fields=teachers,rooms limits the sections; limit/offset page through each
+# section in id order and add per-section totals.
+
 @router.get("")
-def meta():
-    with get_session() as s:
-        return {
-            "teachers": s.exec(select(Teacher)).all(),
-            "subjects": s.exec(select(Subject)).all(),
-            "classes": s.exec(select(ClassGroup)).all(),
-            "rooms": s.exec(select(Room)).all(),
-            "timeslots": s.exec(select(Timeslot)).all(),
-        }
+def meta(fields: str | None = None, limit: int | None = None, offset: int = 0,
+         if_none_match: str | None = Header(None), s: Session = Depends(session_scope)):
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(SECTIONS)
+    unknown = [n for n in names if n not in SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown)}")
+    if (limit is not None and limit < 1) or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and offset non-negative")
+
+    def build():
+        out = {}
+        for name in names:
+            model = SECTIONS[name]
+            q = select(model)
+            if limit is not None:
+                q = q.order_by(model.id).offset(offset).limit(limit)
+            out[name] = s.exec(q).all()
+        if limit is not None:
+            out["page"] = {
+                "offset": offset,
+                "limit": limit,
+                "total": {name: s.exec(select(func.count()).select_from(SECTIONS[name])).one() for name in names},
+            }
+        return out
+    return cache.json_response(("meta", tuple(names), limit, offset), build, if_none_match)
 
 @router.get("/timetable")
-def timetable(view: str, id: int):
-    with get_session() as s:
-        q = select(Assignment)
+def timetable(view: str, id: int, if_none_match: str | None = Header(None), s: Session = Depends(session_scope)):
+    def build():
+        q = select(Assignment).where(Assignment.timetable_id == active_timetable_id(s))
         if view == "class":
             q = q.where(Assignment.class_id == id)
         elif view == "teacher":
             q = q.where(Assignment.teacher_id == id)
         elif view == "room":
             q = q.where(Assignment.room_id == id)
-        items = s.exec(q).all()
-        slots = s.exec(select(Timeslot)).all()
-        return {"assignments": items, "timeslots": slots}
+        return {"assignments": s.exec(q).all(), "timeslots": s.exec(select(Timeslot)).all()}
+    return cache.json_response(("timetable", view, id), build, if_none_match)
+
+@router.get("/timetable/grids")
+def timetable_grids(view: str, ids: str | None = None, if_none_match: str | None = Header(None),
+                    s: Session = Depends(session_scope)):
+    # day x period grids of many classes, teachers or rooms in one request;
+    # ids=1,2,3 (default: all of them)
+    if view not in VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of {', '.join(VIEWS)}")
+    try:
+        wanted = sorted({int(i) for i in ids.split(",") if i.strip()}) if ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+
+    def build():
+        tt_id = active_timetable_id(s)
+        return {"timetable_id": tt_id, "view": view,
+                "grids": load_grids(s, tt_id, view, wanted)}
+    return cache.json_response(("grids", view, tuple(wanted) if wanted is not None else None), build, if_none_match)
@@ -1,41 +1,84 @@
-from fastapi import APIRouter
-from sqlmodel import delete, select
+from fastapi import APIRouter, HTTPException
 try:
-    from ..db import get_session
-    from ..models import Assignment
-    from ..solver.csp import CSP
-    from ..solver.build_problem import load_context, build_variables, build_domains, build_neighbors, consistent_factory
+    from .. import jobs, metrics
+    from ..solver.pipeline import check_options, solve_problem, save_result, list_timetables, activate_timetable
 except ImportError:
-    from db import get_session
-    from models import Assignment
-    from solver.csp import CSP
-    from solver.build_problem import load_context, build_variables, build_domains, build_neighbors, consistent_factory
+    import jobs
+    import metrics
+    from solver.pipeline import check_options, solve_problem, save_result, list_timetables, activate_timetable
 
 router = APIRouter(prefix="/solve", tags=["solve"])
 
 @router.post("")
-def solve():
-    ctx = load_context()
-    variables = build_variables(ctx)
-    domains = build_domains(ctx)
-    neighbors = build_neighbors(variables)
-    consistent = consistent_factory(ctx)
-
-    csp = CSP(variables, domains, neighbors, consistent)
-    assignment = csp.backtrack()
-    status = "feasible" if assignment else "infeasible"
-
-    saved = 0
-    if assignment:
-        with get_session() as s:
-            s.exec(delete(Assignment))
-            s.commit()
-            for v, val in assignment.items():
-                (slot_id, room_id) = val
-                c_id, s_id, t_id, k = v
-                a = Assignment(class_id=c_id, subject_id=s_id, teacher_id=t_id, room_id=room_id, timeslot_id=slot_id)
-                s.add(a)
-            s.commit()
-            saved = len(s.exec(select(Assignment)).all())
-
-    return {"status": status, "saved": saved, "variables": len(variables)}
+def solve(engine: str = "bitset", value_order: str = "lcv", mode: str = "full", decompose: bool = False,
+          workers: int | None = None, seed: int | None = None, portfolio: int = 0,
+          time_limit: float | None = None, node_limit: int | None = None, profile: bool = False):
+    # profile=true runs the solve under cProfile and adds the hottest calls;
+    # time_limit/node_limit return the best partial timetable when reached
+    try:
+        check_options(engine, value_order, mode, workers, portfolio, decompose, time_limit, node_limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    options = dict(engine=engine, value_order=value_order, mode=mode, decompose=decompose,
+                   workers=workers, seed=seed, portfolio=portfolio, time_limit=time_limit, node_limit=node_limit)
+    try:
+        if profile:
+            result, report = metrics.profile_call(solve_problem, **options)
+        else:
+            result, report = solve_problem(**options), None
+    except ValueError as e:  # input data the solver cannot read, e.g. a bad unavailable_json
+        raise HTTPException(status_code=400, detail=str(e))
+    result.update(save_result(result))
+    metrics.record_solve(result)
+    if report is not None:
+        result["profile"] = report
+    return result
+
+# --- Saved timetable versions ---
+
+@router.get("/timetables")
+def timetables():
+    return list_timetables()
+
+@router.post("/timetables/{timetable_id}/activate")
+def activate(timetable_id: int):
+    if not activate_timetable(timetable_id):
+        raise HTTPException(status_code=404, detail="timetable not found")
+    return {"status": "ok", "active": timetable_id}
+
+# --- Background jobs ---
+
+@router.post("/jobs", status_code=202)
+def submit_job(engine: str = "bitset", value_order: str = "lcv", mode: str = "full", decompose: bool = False,
+               workers: int | None = None, seed: int | None = None, portfolio: int = 0,
+               time_limit: float | None = None, node_limit: int | None = None):
+    try:
+        check_options(engine, value_order, mode, workers, portfolio, decompose, time_limit, node_limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    options = {"engine": engine, "value_order": value_order, "mode": mode, "decompose": decompose,
+               "workers": workers, "seed": seed, "portfolio": portfolio, "node_limit": node_limit}
+    job = jobs.get_manager().submit(options, time_limit)
+    return job.info()
+
+def _job_or_404(job_id: str):
+    job = jobs.get_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return _job_or_404(job_id).info()
+
+@router.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = _job_or_404(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"job is {job.status}")
+    return job.result
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    _job_or_404(job_id)
+    return jobs.get_manager().cancel(job_id).info()
@@ -0,0 +1,414 @@
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Search engine for the timetable CSP that keeps per-slot occupancy bitmaps
+# for teachers, classes and rooms instead of calling a pairwise consistent().
+#
+# Slots and rooms are numbered 0..S-1 and 0..R-1; a (slot, room) value is
+# encoded as bit r*S + s, so a domain is a single int.  A set of slots (also
+# an int, S bits wide) expands to "that slot in every room" by multiplying it
+# with REP, which has bit r*S set for every room.  Checking a value and
+# pruning a neighbor are therefore a handful of int operations.
+#
+# Forward checking prunes only the sessions of the same teacher and class.
+# A room clash is left to free(), which masks out the values whose room is
+# taken: pruning every session that could use the room would rewrite most
+# domains on every placement and detect nothing earlier, since room values
+# rarely run out before teacher and class ones.  mrv() counts free values,
+# so a session whose rooms have all gone is still picked first.
+#
+# Sessions of one ClassSubject (same class, subject and teacher) are
+# interchangeable, so they are kept in strictly increasing slot order.
+#
+# With rules (build_problem.Rules), a double period is one variable whose
+# value names its first slot s and also occupies s + 1, the next position in
+# slot_ids; its occupancy is the two-bit slot mask 3 << s.  A teacher's
+# periods per day are counters updated on place/unplace, and once a day is
+# full the teacher's other sessions lose that day's values by forward
+# checking, like any other pruning.
+#
+# Value ordering (value_order):
+#   "lcv"    least-constraining value: fewest values of other unassigned
+#            sessions knocked out, each counted once, as CSP.lcv counts them
+#   "approx" the same score with room counts of the initial domains only
+#   "none"   slots in timetable order, rooms in order
+# With a seed, ties between equally constrained variables and equally good
+# values are broken randomly (but reproducibly) instead of by position.
+#
+# A value of i knocks out, of every other unassigned session's live values
+# (in its domain, room not taken): for the same teacher or class those that
+# overlap its slots in any room, and for a sibling of the same ClassSubject
+# also those on the wrong side of it; for everyone else those that overlap
+# it in its room.  The teacher and class part is counted from those few
+# sessions when a value is chosen.  The room part comes from support
+# counters: per (slot, room) value, how many unassigned sessions of each
+# span have it, kept in bit-planes (rplane[span - 1][b] has the values whose
+# count has bit b set) and updated by a carry or borrow through the planes
+# on whole masks, never bit by bit.  They are built once per shared domain.
+
+VALUE_ORDERS = ("lcv", "approx", "none")
+
+
+class BitsetCSP:
+    def __init__(self, variables, domains, slot_ids: Optional[List[int]] = None, value_order: str = "lcv",
+                 seed: Optional[int] = None, rules=None):
+        if value_order not in VALUE_ORDERS:
+            raise ValueError(f"value_order must be one of {VALUE_ORDERS}")
+        self.value_order = value_order
+        self.variables = list(variables)
+        rnd = random.Random(seed) if seed is not None else None
+        if rnd:
+            rnd.shuffle(self.variables)
+        if slot_ids is None:
+            slot_ids = list(dict.fromkeys(sl for v in self.variables for sl, _ in domains[v]))
+        room_ids = list(dict.fromkeys(r for v in self.variables for _, r in domains[v]))
+        self.slot_ids, self.room_ids = list(slot_ids), room_ids
+        S = self.S = len(self.slot_ids)
+        slot_pos = {sl: i for i, sl in enumerate(self.slot_ids)}
+        room_pos = {r: i for i, r in enumerate(room_ids)}
+        self.REP = sum(1 << (r * S) for r in range(len(room_ids)))
+
+        n = len(self.variables)
+        self.dom = [0] * n
+        masks = {}  # shared domain objects become one shared int
+        for i, v in enumerate(self.variables):
+            vals = domains[v]
+            m = masks.get(id(vals))
+            if m is None:
+                m = 0
+                for sl, r in vals:
+                    m |= 1 << (room_pos[r] * S + slot_pos[sl])
+                masks[id(vals)] = m
+            self.dom[i] = m
+        self.teacher = [v[2] for v in self.variables]
+        self.klass = [v[0] for v in self.variables]
+        self.span = [rules.span(v) if rules else 1 for v in self.variables]
+        self.mapping = [(v[:3], sp) for v, sp in zip(self.variables, self.span)]
+        self.k = [v[3] for v in self.variables]
+        if rules and any(sp == 2 for sp in self.span):
+            for sl, after in rules.next_slot.items():
+                if sl in slot_pos and slot_pos.get(after) != slot_pos[sl] + 1:
+                    raise ValueError("slot_ids must list the periods of each day consecutively")
+        # day of each slot position and per day the slots of that day, in every room
+        days = list(dict.fromkeys(rules.day[sl] for sl in self.slot_ids)) if rules else [None]
+        self.day = [days.index(rules.day[sl]) for sl in self.slot_ids] if rules else [0] * S
+        self.day_mask = [sum(1 << s for s in range(S) if self.day[s] == d) * self.REP for d in range(len(days))]
+        # slots <= s / slots >= s, in every room
+        full = (1 << S) - 1
+        self.at_or_before = [((1 << (s + 1)) - 1) * self.REP for s in range(S)]
+        self.at_or_after = [(full ^ ((1 << s) - 1)) * self.REP for s in range(S)]
+
+        # conflict groups: who has to be re-checked when a value is placed
+        self.by_teacher: Dict[int, List[int]] = {}
+        self.by_class: Dict[int, List[int]] = {}
+        for i in range(n):
+            self.by_teacher.setdefault(self.teacher[i], []).append(i)
+            self.by_class.setdefault(self.klass[i], []).append(i)
+
+        # occupancy: slot bitmaps per teacher/class, value bitmap for rooms
+        self.tbusy = dict.fromkeys(self.by_teacher, 0)
+        self.cbusy = dict.fromkeys(self.by_class, 0)
+        self.rbusy = 0
+        # periods per teacher per day, and each teacher's limit
+        self.limit = {t: rules.daily_limit.get(t) if rules else None for t in self.by_teacher}
+        self.tday = {t: [0] * len(days) for t in self.by_teacher}
+        self.value = [-1] * n
+        self.assigned = 0
+        self.nodes = 0
+        self.backtracks = 0  # exhausted frames
+        self.pruned = 0      # values removed by forward checking
+        self.max_depth = 0
+        self.stopped = False
+        self.best = None  # most complete value list seen by a limited search
+        # tie-break key per value: timetable order, or a seeded shuffle of it
+        V = len(room_ids) * S
+        self.tiebreak = [(vi % S, vi // S) for vi in range(V)]
+        if rnd:
+            self.tiebreak = [rnd.random() for _ in range(V)]
+
+        # support counters: per span, how many unassigned sessions have each
+        # (slot, room) value in their domain
+        self.counting = value_order == "lcv"
+        self.col = [self.REP << s for s in range(S)]  # slot s in every room
+        if value_order != "none":
+            self.rplane = ([0] * n.bit_length(), [0] * n.bit_length())
+            shared: Dict[Tuple[int, int], int] = {}
+            for i in range(n):
+                key = (self.span[i], self.dom[i])
+                shared[key] = shared.get(key, 0) + 1
+            for (span, mask), members in shared.items():
+                for b in range(members.bit_length()):
+                    if members >> b & 1:
+                        _plane_add(self.rplane[span - 1], mask, b)
+
+    def occ(self, i, vi) -> int:
+        # slot mask of the slots a value of i occupies
+        return (1 if self.span[i] == 1 else 3) << (vi % self.S)
+
+    def free(self, i) -> int:
+        busy = self.tbusy[self.teacher[i]] | self.cbusy[self.klass[i]]
+        rbusy = self.rbusy
+        if self.span[i] == 2:
+            # a double starting at s also needs s + 1
+            busy |= busy >> 1
+            rbusy |= rbusy >> 1
+        return self.dom[i] & ~(busy * self.REP | rbusy)
+
+    def live(self) -> Tuple[int, int]:
+        # the values, for a single and for a double, whose rooms are not
+        # taken; forward checking keeps teacher and class clashes out of
+        # unassigned domains, so dom & live() is what free() leaves of them
+        rbusy = self.rbusy
+        return ~rbusy, ~(rbusy | rbusy >> 1)
+
+    def mrv(self) -> int:
+        live, dom, span = self.live(), self.dom, self.span
+        unassigned = [i for i in range(len(self.variables)) if self.value[i] < 0]
+        return min(unassigned, key=lambda i: (dom[i] & live[span[i] - 1]).bit_count())
+
+    def affected(self, i, vi):
+        for group in (self.by_teacher[self.teacher[i]], self.by_class[self.klass[i]]):
+            for u in group:
+                if u != i and self.value[u] < 0:
+                    yield u
+
+    def upto(self, planes) -> List[int]:
+        # upto[x]: how many values start before slot x, from bit-plane counts
+        out, total = [0], 0
+        for col in self.col:
+            total += sum((plane & col).bit_count() << b for b, plane in enumerate(planes) if plane)
+            out.append(total)
+        return out
+
+    def count(self, i, mask, delta):
+        (_plane_add if delta > 0 else _plane_sub)(self.rplane[self.span[i] - 1], mask)
+
+    def order(self, i) -> List[int]:
+        S = self.S
+        cand = self.free(i)
+        tiebreak = self.tiebreak
+        if self.value_order == "none":
+            return sorted(_bits(cand), key=tiebreak.__getitem__)
+        span, live = self.span[i], self.live()
+        # the same teacher or class: per slot s of i, the values of those
+        # sessions that a value starting at s knocks out, in any room.  Their
+        # values and i's own are also collected in planes, to take them back
+        # out of the room counts below.
+        near = dict.fromkeys(u for group in (self.by_teacher[self.teacher[i]], self.by_class[self.klass[i]])
+                             for u in group if self.value[u] < 0)
+        per_slot = [0] * S
+        size = len(self.rplane[0])
+        local = ([0] * size, [0] * size)   # every near session, i included
+        others = ([0] * size, [0] * size)  # those that are not i's siblings
+        for u in near:
+            mask = self.dom[u] & live[self.span[u] - 1]
+            _plane_add(local[self.span[u] - 1], mask)
+            if u == i:
+                continue
+            if self.mapping[u] != self.mapping[i]:
+                _plane_add(others[self.span[u] - 1], mask)
+                continue
+            upto = self.upto([mask])
+            if self.k[u] > self.k[i]:  # must come later: starts up to s are gone
+                per_slot = [x + upto[min(S, s + span)] for s, x in enumerate(per_slot)]
+            else:  # must come earlier: starts from s on (or s - 1 for a double)
+                back = self.span[u] - 1
+                per_slot = [x + upto[S] - upto[max(0, s - back)] for s, x in enumerate(per_slot)]
+        for back, planes in enumerate(others):
+            # values starting in the slots i covers, or for a double one earlier
+            upto = self.upto(planes)
+            per_slot = [x + upto[min(S, s + span)] - upto[max(0, s - back)] for s, x in enumerate(per_slot)]
+        # candidates as masks grouped by score: by slot first, then every
+        # bit-plane of the room counts splits each group in two.  A value vi
+        # meets the singles starting in the slots it covers and the doubles
+        # starting there or one slot earlier, in its room.
+        groups: Dict[int, int] = {}
+        for s, x in enumerate(per_slot):
+            m = cand & self.col[s]
+            if m:
+                groups[x] = groups.get(x, 0) | m
+        for planes, sign in ((self.rplane, 1), (local, -1)):
+            for other, offsets in ((0, range(span)), (1, range(-1, span))):
+                for b, plane in enumerate(planes[other]):
+                    plane &= live[other]
+                    for j in offsets:
+                        hit = (plane >> j if j >= 0 else plane << -j) & cand
+                        if hit:
+                            groups = _split(groups, hit, sign << b)
+        return [vi for x in sorted(groups) for vi in sorted(_bits(groups[x]), key=tiebreak.__getitem__)]
+
+    def place(self, i, vi):
+        occ = self.occ(i, vi)
+        self.tbusy[self.teacher[i]] |= occ
+        self.cbusy[self.klass[i]] |= occ
+        self.rbusy |= occ << (vi - vi % self.S)
+        self.tday[self.teacher[i]][self.day[vi % self.S]] += self.span[i]
+        self.value[i] = vi
+        self.assigned += 1
+        if self.counting:
+            self.count(i, self.dom[i], -1)
+
+    def unplace(self, i, vi):
+        occ = self.occ(i, vi)
+        self.tbusy[self.teacher[i]] &= ~occ
+        self.cbusy[self.klass[i]] &= ~occ
+        self.rbusy &= ~(occ << (vi - vi % self.S))
+        self.tday[self.teacher[i]][self.day[vi % self.S]] -= self.span[i]
+        self.value[i] = -1
+        self.assigned -= 1
+        if self.counting:
+            self.count(i, self.dom[i], 1)
+
+    def forward_check(self, i, vi, trail) -> bool:
+        S, REP = self.S, self.REP
+        s = vi % S
+        occ = self.occ(i, vi)
+        # starts that would overlap occ: for a single the slots themselves,
+        # for a double also the slot before each of them
+        hit = (occ, occ | (occ >> 1))
+        t, c, m, k = self.teacher[i], self.klass[i], self.mapping[i], self.k[i]
+        # the teacher's day is full for singles / has no room left for a double
+        limit, load, day = self.limit[t], self.tday[t][self.day[s]], self.day_mask[self.day[s]]
+        full = (day if limit is not None and load + 1 > limit else 0,
+                day if limit is not None and load + 2 > limit else 0)
+        for u in self.affected(i, vi):
+            old = self.dom[u]
+            j = self.span[u] - 1
+            block = hit[j] * REP
+            if self.teacher[u] == t:
+                block |= full[j]
+            if self.mapping[u] == m:
+                block |= self.at_or_before[s] if self.k[u] > k else self.at_or_after[s]
+            gone = old & block
+            if gone:
+                # the trail keeps only the removed bits, not a copy of the domain
+                trail.append((u, gone))
+                self.dom[u] = new = old ^ gone
+                self.pruned += gone.bit_count()
+                if self.counting:
+                    self.count(u, gone, -1)
+                if not new:
+                    return False
+        return True
+
+    def narrow(self, u, new, trail) -> bool:
+        # replace u's domain with the subset new; False if it is empty (for
+        # subclasses; forward_check inlines this, it is the hot loop)
+        gone = self.dom[u] & ~new
+        trail.append((u, gone))
+        self.dom[u] = new
+        self.pruned += gone.bit_count()
+        if self.counting:
+            self.count(u, gone, -1)
+        return bool(new)
+
+    def undo(self, trail, mark):
+        while len(trail) > mark:
+            u, gone = trail.pop()
+            if self.counting:
+                self.count(u, gone, 1)
+            self.dom[u] |= gone
+
+    def stats(self) -> Dict[str, int]:
+        return {"nodes": self.nodes, "backtracks": self.backtracks, "pruned": self.pruned,
+                "max_depth": self.max_depth}
+
+    def result(self, values=None) -> Dict[Tuple, Tuple[int, int]]:
+        # a double period's value is its first slot
+        S = self.S
+        return {v: (self.slot_ids[vi % S], self.room_ids[vi // S])
+                for v, vi in zip(self.variables, self.value if values is None else values) if vi >= 0}
+
+    def best_partial(self) -> Dict[Tuple, Tuple[int, int]]:
+        # the most sessions placed at once during a limited search
+        return self.result(self.best) if self.best is not None else {}
+
+    def backtrack(self, node_limit=None, deadline=None):
+        # Same explicit-stack search as CSP.backtrack: frames are (var, remaining
+        # values, trail mark) and backtracking pops the trail back to the mark.
+        # Gives up (returns None with self.stopped set) after node_limit values
+        # have been tried or once time.time() passes deadline; best_partial()
+        # then has the largest partial assignment it reached.  nodes,
+        # backtracks, pruned and max_depth accumulate over calls; stats()
+        # returns them.
+        n = len(self.variables)
+        limited = node_limit is not None or deadline is not None
+        best_count = sum(1 for vi in self.best if vi >= 0) if self.best is not None else -1
+        if self.assigned == n:
+            return self.result()
+        trail = []
+        i = self.mrv()
+        stack = [(i, iter(self.order(i)), 0)]
+        self.max_depth = max(self.max_depth, 1)
+        while stack:
+            i, values, mark = stack[-1]
+            if self.value[i] >= 0:
+                self.unplace(i, self.value[i])
+                self.undo(trail, mark)
+            for vi in values:
+                if not (self.free(i) >> vi) & 1:
+                    continue
+                if limited and ((node_limit is not None and self.nodes >= node_limit)
+                                or (deadline is not None and time.time() >= deadline)):
+                    self.stopped = True
+                    return None
+                self.nodes += 1
+                self.place(i, vi)
+                if self.forward_check(i, vi, trail):
+                    break
+                self.unplace(i, vi)
+                self.undo(trail, mark)
+            else:
+                stack.pop()
+                self.backtracks += 1
+                continue
+            if self.assigned == n:
+                return self.result()
+            if limited and self.assigned > best_count:
+                self.best, best_count = list(self.value), self.assigned
+            u = self.mrv()
+            stack.append((u, iter(self.order(u)), len(trail)))
+            self.max_depth = max(self.max_depth, len(stack))
+        return None
+
+
+def _bits(m: int) -> List[int]:
+    # positions of the set bits, lowest first; str.find walks the binary
+    # digits in C instead of one big-int operation per bit
+    digits = bin(m)[:1:-1]
+    out = []
+    b = digits.find("1")
+    while b >= 0:
+        out.append(b)
+        b = digits.find("1", b + 1)
+    return out
+
+
+def _split(groups: Dict[int, int], hit: int, weight: int) -> Dict[int, int]:
+    # score -> mask of values, with weight added to the score of those in hit
+    out: Dict[int, int] = {}
+    for x, m in groups.items():
+        up = m & hit
+        if up:
+            out[x + weight] = out.get(x + weight, 0) | up
+        if m ^ up:
+            out[x] = out.get(x, 0) | (m ^ up)
+    return out
+
+
+def _plane_add(planes: List[int], m: int, b: int = 0):
+    # add 1 << b to the bit-plane count of every value in m
+    while m:
+        carry = planes[b] & m
+        planes[b] ^= m
+        m, b = carry, b + 1
+
+
+def _plane_sub(planes: List[int], m: int):
+    # take 1 from the count of every value in m; none of them may be 0
+    b = 0
+    while m:
+        borrow = m & ~planes[b]
+        planes[b] ^= m
+        m, b = borrow, b + 1
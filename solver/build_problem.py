@@ -1,4 +1,6 @@
-from typing import Dict, List, Tuple
+import json
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, List, Sequence, Tuple
 from sqlmodel import select
 try:
     from ..models import ClassGroup, Subject, Teacher, Room, Timeslot, ClassSubject
@@ -32,57 +34,198 @@ def sessions_for_map(ctx, m: ClassSubject) -> int:
     sub = ctx["subjects"][m.subject_id]
     return m.required_hours or sub.hours_per_week
 
+def doubles_for_map(ctx, m: ClassSubject) -> int:
+    # hours of a subject that allows double periods are paired up; an odd
+    # hour left over is a single session
+    if not ctx["subjects"][m.subject_id].allow_double_period:
+        return 0
+    return sessions_for_map(ctx, m) // 2
+
 def build_variables(ctx):
+    # one variable per session; a double period is one session over two
+    # consecutive slots, so a ClassSubject with n hours and d doubles has
+    # n - d variables, the doubles first (k < d)
     vars_list = []
     for m in ctx["maps"]:
-        n = sessions_for_map(ctx, m)
+        n = sessions_for_map(ctx, m) - doubles_for_map(ctx, m)
         for k in range(n):
             vars_list.append((m.class_id, m.subject_id, m.teacher_id, k))
     return vars_list
 
+def next_slots(ctx) -> Dict[int, int]:
+    # slot -> the slot right after it on the same day, for pairs a double
+    # period can take (neither of them lunch)
+    by_day = {(t.day, t.slot_index): t for t in ctx["slot_list"] if not t.is_lunch}
+    return {t.id: by_day[(day, index + 1)].id
+            for (day, index), t in by_day.items() if (day, index + 1) in by_day}
+
+def unavailable_slots(teacher, slot_list) -> FrozenSet[int]:
+    # Teacher.unavailable_json is a JSON list whose entries are timeslot ids,
+    # day names (the whole day) or {"day": ..., "slot_index": ...} objects
+    if not teacher.unavailable_json:
+        return frozenset()
+    try:
+        entries = json.loads(teacher.unavailable_json)
+    except ValueError:
+        entries = None
+    if not isinstance(entries, list):
+        raise ValueError(f"teacher {teacher.code}: unavailable_json must be a JSON list")
+    out = set()
+    for e in entries:
+        if isinstance(e, int):
+            out.add(e)
+        elif isinstance(e, str):
+            out.update(t.id for t in slot_list if t.day == e)
+        elif isinstance(e, dict) and "day" in e:
+            out.update(t.id for t in slot_list
+                       if t.day == e["day"] and e.get("slot_index") in (None, t.slot_index))
+        else:
+            raise ValueError(f"teacher {teacher.code}: cannot read unavailable_json entry {e!r}")
+    return frozenset(out)
+
+class Rules:
+    # The constraints that are not a plain clash between two sessions: how
+    # many consecutive slots a session takes, and how many periods a teacher
+    # may teach per day.  Values of a double period name its first slot;
+    # cover() gives every slot it occupies.
+    def __init__(self, ctx):
+        self.doubles = {(m.class_id, m.subject_id, m.teacher_id): doubles_for_map(ctx, m) for m in ctx["maps"]}
+        self.next_slot = next_slots(ctx)
+        self.day = {t.id: t.day for t in ctx["slot_list"]}
+        self.daily_limit = {t.id: t.max_daily_load for t in ctx["teachers"].values()}
+
+    def span(self, v: Var) -> int:
+        return 2 if v[3] < self.doubles.get(v[:3], 0) else 1
+
+    def cover(self, v: Var, slot_id: int) -> Tuple[int, ...]:
+        return self.slots(self.span(v), slot_id)
+
+    def slots(self, span: int, slot_id: int) -> Tuple[int, ...]:
+        if span == 2:
+            return (slot_id, self.next_slot[slot_id])
+        return (slot_id,)
+
+    def load(self, v: Var, val) -> List[tuple]:
+        # [((teacher_id, day), periods, daily limit)] for a session at val
+        cap = self.daily_limit.get(v[2])
+        if cap is None:
+            return []
+        return [((v[2], self.day[val[0]]), self.span(v), cap)]
+
+    def doubles_of(self, assignment) -> Dict[Var, int]:
+        # double period -> its second slot, for persisting both
+        return {v: self.next_slot[val[0]] for v, val in assignment.items() if self.span(v) == 2}
+
 def timeslot_ok(slot, subject):
     if slot.is_lunch:
         return False
     return True
 
-def build_domains(ctx) -> Dict[Var, List[Tuple[int,int]]]:
+def build_domains(ctx, variables=None) -> Dict[Var, Sequence[Tuple[int,int]]]:
+    # Sessions with the same subject type, suitable rooms (type and
+    # capacity), span and teacher availability get the same tuple object;
+    # engines never edit a domain in place, so it stays shared until search
+    # replaces it with a pruned copy.  Slots the teacher is unavailable for
+    # never enter the domain, and a double period's values are the first
+    # slots of the pairs in next_slots() with both slots available.
+    if variables is None:
+        variables = build_variables(ctx)
+    rules = Rules(ctx)
+    unavailable = {}
+    suitable = {}  # (subject type, class size) -> room ids
+    interned = {}
     domains = {}
-    for v in build_variables(ctx):
+    for v in variables:
         class_id, subject_id, teacher_id, k = v
         cl = ctx["classes"][class_id]
         sub = ctx["subjects"][subject_id]
-        vals = []
-        for slot in ctx["slot_list"]:
-            if not timeslot_ok(slot, sub):
-                continue
-            for room in ctx["rooms"].values():
-                if room.type != sub.type:
-                    continue
-                if room.capacity < cl.size:
+        teacher = ctx["teachers"][teacher_id]
+        if teacher_id not in unavailable:
+            unavailable[teacher_id] = unavailable_slots(teacher, ctx["slot_list"])
+        off = unavailable[teacher_id]
+        rooms = suitable.get((sub.type, cl.size))
+        if rooms is None:
+            rooms = suitable[(sub.type, cl.size)] = tuple(
+                room.id for room in ctx["rooms"].values() if room.type == sub.type and room.capacity >= cl.size)
+        span = rules.span(v)
+        # timeslot_ok() only looks at the slot, so the subject itself is not part of the key
+        key = (sub.type, rooms, span, off, span > teacher.max_daily_load)
+        vals = interned.get(key)
+        if vals is None:
+            vals = []
+            # a double the teacher may not teach in one day has no values
+            for slot in ctx["slot_list"] if span <= teacher.max_daily_load else ():
+                if not timeslot_ok(slot, sub) or slot.id in off:
                     continue
-                vals.append((slot.id, room.id))
+                if span == 2:
+                    after = rules.next_slot.get(slot.id)
+                    if after is None or after in off:
+                        continue
+                vals.extend((slot.id, room_id) for room_id in rooms)
+            vals = interned[key] = tuple(vals)
         domains[v] = vals
     return domains
 
-def build_neighbors(variables: List[Var]) -> Dict[Var, set]:
-    neighbors = {v:set() for v in variables}
-    for i, v in enumerate(variables):
-        c,s,t,k = v
-        for j in range(i+1, len(variables)):
-            u = variables[j]
-            c2,s2,t2,k2 = u
-            neighbors[v].add(u)
-            neighbors[u].add(v)
-    return neighbors
+class Neighbors(Mapping):
+    # var -> set of vars it can conflict with.  Two kinds, kept apart:
+    # near(v), the vars of the same teacher or class, which clash with v in
+    # any room, and rooms(v), the vars whose candidate rooms overlap v's,
+    # which clash only on a value in the same room.  near sets are built once
+    # per var; a rooms set is shared by every var of a pool (vars with the
+    # same candidate rooms) and includes v itself and its near vars.
+    def __init__(self, near: Dict[Var, FrozenSet[Var]], pool_of: Dict[Var, FrozenSet[Var]]):
+        self._near = near
+        self._rooms = pool_of
+
+    def near(self, v: Var) -> FrozenSet[Var]:
+        return self._near[v]
+
+    def rooms(self, v: Var) -> FrozenSet[Var]:
+        return self._rooms[v]
+
+    def __getitem__(self, v: Var) -> set:
+        out = set(self._rooms[v])
+        out.update(self._near[v])
+        out.discard(v)
+        return out
+
+    def __iter__(self):
+        return iter(self._near)
+
+    def __len__(self):
+        return len(self._near)
+
+def build_neighbors(variables: List[Var], domains: Dict[Var, Sequence[Tuple[int,int]]]) -> Neighbors:
+    by_teacher, by_class, pools = {}, {}, {}
+    for v in variables:
+        c, s, t, k = v
+        by_teacher.setdefault(t, []).append(v)
+        by_class.setdefault(c, []).append(v)
+        pools.setdefault(frozenset(r for _, r in domains[v]), []).append(v)
+    near = {v: frozenset(by_teacher[v[2]]).union(by_class[v[0]]).difference((v,)) for v in variables}
+
+    # two pools compete for rooms only if their candidate room sets overlap
+    pool_of = {}
+    for rooms, members in pools.items():
+        shared = frozenset(u for other, users in pools.items() if other & rooms for u in users)
+        for v in members:
+            pool_of[v] = shared
+    return Neighbors(near, pool_of)
 
 def consistent_factory(ctx):
+    slot_pos = {slot.id: i for i, slot in enumerate(ctx["slot_list"])}
+    rules = Rules(ctx)
+    spans = {}
     def consistent(v, val, u, uval):
         (slot_id, room_id) = val
         (slot2_id, room2_id) = uval
-        if slot_id != slot2_id:
-            return True
         c,s,t,k = v
         c2,s2,t2,k2 = u
+        # sessions of one ClassSubject are interchangeable: keep them in slot order
+        if (c, s, t) == (c2, s2, t2):
+            return slot_id != slot2_id and (k < k2) == (slot_pos[slot_id] < slot_pos[slot2_id])
+        if slot_id != slot2_id:
+            return True
         if t == t2:
             return False
         if c == c2:
@@ -90,4 +233,18 @@ def consistent_factory(ctx):
         if room_id == room2_id:
             return False
         return True
-    return consistent
+    def consistent_doubles(v, val, u, uval):
+        # the same checks on the slots each session covers
+        (slot_id, room_id) = val
+        (slot2_id, room2_id) = uval
+        span = spans.get(v) or spans.setdefault(v, rules.span(v))
+        span2 = spans.get(u) or spans.setdefault(u, rules.span(u))
+        if span == span2 == 1:
+            return consistent(v, val, u, uval)
+        overlap = not set(rules.cover(v, slot_id)).isdisjoint(rules.cover(u, slot2_id))
+        if span == span2 and v[:3] == u[:3]:
+            return not overlap and (v[3] < u[3]) == (slot_pos[slot_id] < slot_pos[slot2_id])
+        if not overlap:
+            return True
+        return v[2] != u[2] and v[0] != u[0] and room_id != room2_id
+    return consistent_doubles if any(rules.doubles.values()) else consistent
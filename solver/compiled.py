@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+try:
+    from .build_problem import load_context, build_variables, build_domains, Rules
+    from .decompose import components
+    from .propagate import reduce, Infeasible
+except ImportError:
+    from solver.build_problem import load_context, build_variables, build_domains, Rules
+    from solver.decompose import components
+    from solver.propagate import reduce, Infeasible
+
+# Compiled problems (variables, domains, components) memoized on a fingerprint
+# of the input tables, so solving unchanged data skips the build phase.  Each
+# entry also remembers the timetables found for it, keyed by the options
+# that determine the result; an identical request is answered from there.
+# The cache lives in this process: background jobs run in fresh processes
+# and build from scratch.
+
+PROBLEM_CACHE_SIZE = int(os.getenv("PROBLEM_CACHE_SIZE", "8"))
+SOLUTIONS_PER_PROBLEM = 4
+
+_problems = OrderedDict()  # fingerprint -> Problem
+_lock = threading.Lock()
+
+_TABLES = ("classes", "subjects", "teachers", "rooms", "slots")
+
+
+def fingerprint(ctx) -> str:
+    # content hash of every input row, independent of load order
+    h = hashlib.sha1()
+    for name in _TABLES:
+        for row in sorted(ctx[name].values(), key=lambda x: x.id):
+            h.update(repr(sorted(row.model_dump().items())).encode())
+        h.update(b"|")
+    for m in sorted(ctx["maps"], key=lambda x: x.id):
+        h.update(repr(sorted(m.model_dump().items())).encode())
+    return h.hexdigest()
+
+
+class Problem:
+    def __init__(self, ctx, fingerprint):
+        self.ctx = ctx
+        self.fingerprint = fingerprint
+        self.variables = build_variables(ctx)
+        self.domains = build_domains(ctx, self.variables)
+        self.slot_ids = [t.id for t in ctx["slot_list"]]
+        self.rules = Rules(ctx)
+        self.solutions = OrderedDict()  # options key -> (status, assignment, reason)
+        self._parts = None
+        self._reduced = None
+
+    def solution(self, key):
+        with _lock:
+            hit = self.solutions.get(key)
+            if hit is not None:
+                self.solutions.move_to_end(key)
+            return hit
+
+    def remember(self, key, status, assignment, reason=None):
+        # reason: why propagation proved the input infeasible, if it did
+        with _lock:
+            self.solutions[key] = (status, assignment, reason)
+            self.solutions.move_to_end(key)
+            while len(self.solutions) > SOLUTIONS_PER_PROBLEM:
+                self.solutions.popitem(last=False)
+
+    def reduced(self):
+        # -> (domains after root propagation, its stats, None) or, when
+        # propagation proves the input infeasible, (the original domains,
+        # None, the reason); computed once per problem
+        if self._reduced is None:
+            names = {kind: {x.id: x.name for x in self.ctx[table].values()}
+                     for kind, table in (("teacher", "teachers"), ("class", "classes"),
+                                         ("subject", "subjects"), ("room", "rooms"))}
+            try:
+                domains, stats = reduce(self.variables, self.domains, self.rules, names)
+                self._reduced = (domains, stats, None)
+            except Infeasible as e:
+                self._reduced = (self.domains, None, e.info)
+        return self._reduced
+
+    def parts(self):
+        if self._parts is None:
+            self._parts = components(self.variables, self.domains)
+        return self._parts
+
+
+def get_problem(ctx=None):
+    # -> (Problem, cached?)
+    if ctx is None:
+        ctx = load_context()
+    fp = fingerprint(ctx)
+    with _lock:
+        problem = _problems.get(fp)
+        if problem is not None:
+            _problems.move_to_end(fp)
+            return problem, True
+    problem = Problem(ctx, fp)
+    with _lock:
+        problem = _problems.setdefault(fp, problem)
+        _problems.move_to_end(fp)
+        while len(_problems) > PROBLEM_CACHE_SIZE:
+            _problems.popitem(last=False)
+    return problem, False
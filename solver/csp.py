@@ -1,21 +1,53 @@
-from collections import defaultdict
+import random
+import time
+from itertools import chain
 
 class CSP:
-    def __init__(self, variables, domains, neighbors, consistent):
+    def __init__(self, variables, domains, neighbors, consistent, value_order="lcv", seed=None, load=None):
+        # load(v, val) -> [(key, amount, limit)] for constraints on a total
+        # rather than on a pair (a teacher's periods per day); the totals are
+        # counters kept up to date as values are assigned and taken back
         self.variables = list(variables)
-        self.domains = {v: list(domains[v]) for v in self.variables}
+        self.domains = {v: domains[v] for v in self.variables}
         self.neighbors = neighbors
+        self._room_users = {}
         self.consistent = consistent
         self.assignment = {}
+        self.value_order = value_order
+        # a seed randomizes tie-breaking between equally good variables and values
+        self.rnd = random.Random(seed) if seed is not None else None
+        if self.rnd:
+            self.rnd.shuffle(self.variables)
+        self.nodes = 0
+        self.backtracks = 0
+        self.pruned = 0
+        self.max_depth = 0
+        self.stopped = False
+        self.best = {}  # largest partial assignment seen by a limited search
+        self.load = load
+        self.used = {}
+
+    def stats(self):
+        return {"nodes": self.nodes, "backtracks": self.backtracks, "pruned": self.pruned,
+                "max_depth": self.max_depth}
 
     def mrv(self):
         unassigned = [v for v in self.variables if v not in self.assignment]
         return min(unassigned, key=lambda v: len(self.domains[v]))
 
+    def room_users(self, v):
+        # neighbors that clash with v only on a value in the same room
+        users = self._room_users.get(v)
+        if users is None:
+            near = self.neighbors.near(v)
+            users = self._room_users[v] = [u for u in self.neighbors.rooms(v) if u != v and u not in near]
+        return users
+
     def lcv(self, v):
+        near, room_users = self.neighbors.near(v), self.room_users(v)
         def conflicts(val):
             c = 0
-            for u in self.neighbors[v]:
+            for u in near:
                 if u in self.assignment:
                     if not self.consistent(v, val, u, self.assignment[u]):
                         c += 1
@@ -23,40 +55,119 @@ class CSP:
                 for uval in self.domains[u]:
                     if not self.consistent(v, val, u, uval):
                         c += 1
+            room = val[1]
+            for u in room_users:
+                if u in self.assignment:
+                    uval = self.assignment[u]
+                    if uval[1] == room and not self.consistent(v, val, u, uval):
+                        c += 1
+                    continue
+                for uval in self.domains[u]:
+                    if uval[1] == room and not self.consistent(v, val, u, uval):
+                        c += 1
             return c
-        return sorted(self.domains[v], key=conflicts)
+        return sorted(self.shuffled(self.domains[v]), key=conflicts)
+
+    def shuffled(self, values):
+        if not self.rnd:
+            return values
+        values = list(values)
+        self.rnd.shuffle(values)
+        return values
 
-    def forward_check(self, v, val, pruned):
-        for u in self.neighbors[v]:
-            if u in self.assignment: 
+    def order(self, v):
+        if self.value_order == "none":
+            return self.shuffled(self.domains[v])
+        return self.lcv(v)
+
+    def fits(self, v, val):
+        return all(self.used.get(key, 0) + amount <= limit for key, amount, limit in self.load(v, val))
+
+    def assign(self, v, val):
+        self.assignment[v] = val
+        if self.load:
+            for key, amount, _ in self.load(v, val):
+                self.used[key] = self.used.get(key, 0) + amount
+
+    def unassign(self, v):
+        val = self.assignment.pop(v)
+        if self.load:
+            for key, amount, _ in self.load(v, val):
+                self.used[key] -= amount
+
+    def forward_check(self, v, val, trail):
+        # Pruned domains are replaced, not edited in place; the trail keeps the
+        # previous list so undo is a pop and restores the original order.
+        # Sessions sharing only candidate rooms with v are checked on the
+        # values in val's room alone.
+        room, near = val[1], self.neighbors.near(v)
+        for u in chain(near, self.room_users(v)):
+            if u in self.assignment:
                 continue
-            to_remove = [uval for uval in list(self.domains[u]) if not self.consistent(v, val, u, uval)]
-            if to_remove:
-                for r in to_remove:
-                    self.domains[u].remove(r)
-                pruned[u].extend(to_remove)
-                if not self.domains[u]:
+            dom = self.domains[u]
+            if u in near:
+                keep = [uval for uval in dom if self.consistent(v, val, u, uval)]
+            else:
+                keep = [uval for uval in dom if uval[1] != room or self.consistent(v, val, u, uval)]
+            if len(keep) != len(dom):
+                self.pruned += len(dom) - len(keep)
+                trail.append((u, dom))
+                self.domains[u] = keep
+                if not keep:
                     return False
         return True
 
-    def backtrack(self):
+    def undo(self, trail, mark):
+        while len(trail) > mark:
+            u, dom = trail.pop()
+            self.domains[u] = dom
+
+    def best_partial(self):
+        return dict(self.best)
+
+    def backtrack(self, node_limit=None, deadline=None):
+        # Depth-first search with an explicit stack of (var, remaining values,
+        # trail mark) frames, so depth is not bounded by the recursion limit.
+        # Gives up (returns None with self.stopped set) after node_limit
+        # values have been tried or once time.time() passes deadline, keeping
+        # the largest partial assignment for best_partial().  stats() reports nodes, backtracks (exhausted
+        # frames), values pruned by forward checking and the deepest stack.
         if len(self.assignment) == len(self.variables):
             return dict(self.assignment)
+        limited = node_limit is not None or deadline is not None
+        trail = []
         v = self.mrv()
-        for val in self.lcv(v):
-            ok = True
-            for u, uval in self.assignment.items():
-                if not self.consistent(v, val, u, uval):
-                    ok = False; break
-            if not ok:
+        stack = [(v, iter(self.order(v)), 0)]
+        self.max_depth = max(self.max_depth, 1)
+        while stack:
+            v, values, mark = stack[-1]
+            if v in self.assignment:
+                self.unassign(v)
+                self.undo(trail, mark)
+            for val in values:
+                if self.load and not self.fits(v, val):
+                    continue
+                if not all(self.consistent(v, val, u, uval) for u, uval in self.assignment.items()):
+                    continue
+                if limited and ((node_limit is not None and self.nodes >= node_limit)
+                                or (deadline is not None and time.time() >= deadline)):
+                    self.stopped = True
+                    return None
+                self.nodes += 1
+                self.assign(v, val)
+                if self.forward_check(v, val, trail):
+                    break
+                self.unassign(v)
+                self.undo(trail, mark)
+            else:
+                stack.pop()
+                self.backtracks += 1
                 continue
-            self.assignment[v] = val
-            pruned = defaultdict(list)
-            if self.forward_check(v, val, pruned):
-                res = self.backtrack()
-                if res:
-                    return res
-            del self.assignment[v]
-            for u, vals in pruned.items():
-                self.domains[u].extend(vals)
+            if len(self.assignment) == len(self.variables):
+                return dict(self.assignment)
+            if limited and len(self.assignment) > len(self.best):
+                self.best = dict(self.assignment)
+            u = self.mrv()
+            stack.append((u, iter(self.order(u)), len(trail)))
+            self.max_depth = max(self.max_depth, len(stack))
         return None
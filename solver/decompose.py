@@ -0,0 +1,41 @@
+from typing import Dict, List, Tuple
+
+# Split the timetable into independent sub-problems.  Two sessions end up in
+# the same component when they are linked by a chain of shared teachers,
+# classes or candidate rooms; sessions in different components can never
+# conflict, so each component can be searched on its own.
+
+Var = Tuple[int, int, int, int]
+
+
+def components(variables, domains) -> List[List[Var]]:
+    parent: Dict[object, object] = {}
+
+    def find(x):
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+
+    rooms_of = {}  # one room set per shared domain object
+    for v in variables:
+        c, s, t, k = v
+        union(v, ("t", t))
+        union(v, ("c", c))
+        rooms = rooms_of.get(id(domains[v]))
+        if rooms is None:
+            rooms = rooms_of[id(domains[v])] = {r for _, r in domains[v]}
+        for r in rooms:
+            union(v, ("r", r))
+
+    groups: Dict[object, List[Var]] = {}
+    for v in variables:
+        groups.setdefault(find(v), []).append(v)
+    return sorted(groups.values(), key=len, reverse=True)
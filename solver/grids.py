@@ -0,0 +1,88 @@
+import json
+from sqlmodel import select
+try:
+    from ..models import Assignment, ClassGroup, Room, Subject, Teacher, Timeslot, TimetableGrid
+except ImportError:
+    from models import Assignment, ClassGroup, Room, Subject, Teacher, Timeslot, TimetableGrid
+
+# Day x period grids for every class, teacher and room of a timetable,
+# rendered once when the timetable is saved and stored as JSON so the grid
+# endpoint only reads rows.  Days keep the order the timeslots were created
+# in, periods are the distinct slot indexes; a cell is null when nothing is
+# scheduled and {"lunch": true} for lunch slots.
+
+VIEWS = {"class": "class_id", "teacher": "teacher_id", "room": "room_id"}
+
+
+def build_grids(s, rows):
+    # rows: assignment dicts or Assignment objects -> {(view, id): grid}
+    slots = s.exec(select(Timeslot).order_by(Timeslot.id)).all()
+    days, periods = [], sorted({t.slot_index for t in slots})
+    for t in slots:
+        if t.day not in days:
+            days.append(t.day)
+    where = {t.id: (days.index(t.day), periods.index(t.slot_index)) for t in slots}
+    names = {
+        "class": dict(s.exec(select(ClassGroup.id, ClassGroup.name)).all()),
+        "subject": dict(s.exec(select(Subject.id, Subject.name)).all()),
+        "teacher": dict(s.exec(select(Teacher.id, Teacher.name)).all()),
+        "room": dict(s.exec(select(Room.id, Room.name)).all()),
+    }
+
+    def empty(view, entity_id):
+        cells = [[None] * len(periods) for _ in days]
+        for t in slots:
+            if t.is_lunch:
+                d, p = where[t.id]
+                cells[d][p] = {"lunch": True}
+        return {"view": view, "id": entity_id, "name": names[view].get(entity_id),
+                "days": days, "periods": periods, "cells": cells}
+
+    grids = {}
+    for row in rows:
+        row = row if isinstance(row, dict) else row.model_dump()
+        if row["timeslot_id"] not in where:
+            continue
+        d, p = where[row["timeslot_id"]]
+        cell = {
+            "class_id": row["class_id"], "class": names["class"].get(row["class_id"]),
+            "subject_id": row["subject_id"], "subject": names["subject"].get(row["subject_id"]),
+            "teacher_id": row["teacher_id"], "teacher": names["teacher"].get(row["teacher_id"]),
+            "room_id": row["room_id"], "room": names["room"].get(row["room_id"]),
+            "timeslot_id": row["timeslot_id"], "is_double": row["is_double"],
+        }
+        for view, column in VIEWS.items():
+            key = (view, row[column])
+            if key not in grids:
+                grids[key] = empty(*key)
+            grids[key]["cells"][d][p] = cell
+    return grids
+
+
+def save_grids(s, timetable_id, rows):
+    # adds the grid rows to the session; the caller commits
+    s.add_all([
+        TimetableGrid(timetable_id=timetable_id, view=view, entity_id=entity_id,
+                      grid_json=json.dumps(grid, separators=(",", ":")))
+        for (view, entity_id), grid in build_grids(s, rows).items()
+    ])
+
+
+def load_grids(s, timetable_id, view, ids=None):
+    # -> list of grids in id order; renders and stores them first for
+    # timetables saved before grids were materialized
+    if timetable_id is None:
+        # unversioned assignments of an old database: render, nothing to store under
+        rows = s.exec(select(Assignment).where(Assignment.timetable_id == None)).all()
+        grids = build_grids(s, rows)
+        return [grids[key] for key in sorted(grids) if key[0] == view and (ids is None or key[1] in ids)]
+    if s.exec(select(TimetableGrid.id).where(TimetableGrid.timetable_id == timetable_id).limit(1)).first() is None:
+        rows = s.exec(select(Assignment).where(Assignment.timetable_id == timetable_id)).all()
+        if not rows:
+            return []
+        save_grids(s, timetable_id, rows)
+        s.commit()
+    q = select(TimetableGrid.grid_json).where(TimetableGrid.timetable_id == timetable_id, TimetableGrid.view == view)
+    if ids is not None:
+        q = q.where(TimetableGrid.entity_id.in_(ids))
+    return [json.loads(g) for g in s.exec(q.order_by(TimetableGrid.entity_id)).all()]
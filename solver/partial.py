@@ -0,0 +1,96 @@
+from typing import Dict, List, Tuple
+
+# Best-effort results for solves stopped by a time or node limit.  The
+# search hands back the largest partial assignment it reached; fill() places
+# whatever else still fits without moving anything, and explain() says for
+# each session left over how many of its slots each constraint blocks (its
+# teacher or class already taken, the teacher at the daily limit, every
+# suitable room in use) and names the one that blocks the most.  With rules
+# (build_problem.Rules) a double period takes both of its slots.
+
+Var = Tuple[int, int, int, int]
+
+REASONS = {
+    "no_suitable_room": "no room of the required type and capacity exists in a slot the teacher is available",
+    "teacher_busy": "the teacher's other sessions block the most of this session's slots (see blocked_slots)",
+    "daily_load": "the teacher's daily limit blocks the most of this session's slots (see blocked_slots)",
+    "class_busy": "the class's other sessions block the most of this session's slots (see blocked_slots)",
+    "rooms_full": "rooms already in use block the most of this session's slots (see blocked_slots)",
+}
+
+
+def _cover(rules, v, slot):
+    return rules.cover(v, slot) if rules is not None else (slot,)
+
+
+def _fits_day(rules, used, v, slot):
+    return rules is None or all(used.get(key, 0) + n <= cap for key, n, cap in rules.load(v, (slot, None)))
+
+
+def _occupancy(placed, rules=None):
+    teacher, klass, room, used = set(), set(), set(), {}
+    for v, (slot, r) in placed.items():
+        _take(rules, (teacher, klass, room, used), v, slot, r)
+    return teacher, klass, room, used
+
+
+def _take(rules, occupancy, v, slot, r):
+    teacher, klass, room, used = occupancy
+    c, _, t, _ = v
+    for sl in _cover(rules, v, slot):
+        teacher.add((t, sl))
+        klass.add((c, sl))
+        room.add((r, sl))
+    if rules is not None:
+        for key, n, _ in rules.load(v, (slot, r)):
+            used[key] = used.get(key, 0) + n
+
+
+def fill(variables, domains, placed, rules=None) -> Dict[Var, Tuple[int, int]]:
+    # greedily add unplaced sessions, most constrained first
+    placed = dict(placed)
+    occupancy = _occupancy(placed, rules)
+    teacher, klass, room, used = occupancy
+    for v in sorted((v for v in variables if v not in placed), key=lambda v: len(domains[v])):
+        c, _, t, _ = v
+        for slot, r in domains[v]:
+            slots = _cover(rules, v, slot)
+            if (all((t, sl) not in teacher and (c, sl) not in klass and (r, sl) not in room for sl in slots)
+                    and _fits_day(rules, used, v, slot)):
+                placed[v] = (slot, r)
+                _take(rules, occupancy, v, slot, r)
+                break
+    return placed
+
+
+def explain(variables, domains, placed, rules=None) -> List[dict]:
+    teacher, klass, room, used = _occupancy(placed, rules)
+    out = []
+    for v in variables:
+        if v in placed:
+            continue
+        c, s, t, k = v
+        rooms_by_slot = {}
+        for slot, r in domains[v]:
+            rooms_by_slot.setdefault(slot, []).append(r)
+        # each candidate slot is charged to the first constraint that rules it
+        # out; the reason is the largest share, blocked_slots the breakdown
+        blocked = {"teacher": 0, "class": 0, "day": 0, "rooms": 0}
+        for slot, rooms in rooms_by_slot.items():
+            slots = _cover(rules, v, slot)
+            if any((t, sl) in teacher for sl in slots):
+                blocked["teacher"] += 1
+            elif any((c, sl) in klass for sl in slots):
+                blocked["class"] += 1
+            elif not _fits_day(rules, used, v, slot):
+                blocked["day"] += 1
+            elif all(any((r, sl) in room for sl in slots) for r in rooms):
+                blocked["rooms"] += 1
+        if not rooms_by_slot:
+            reason = "no_suitable_room"
+        else:
+            reason = {"teacher": "teacher_busy", "class": "class_busy", "day": "daily_load", "rooms": "rooms_full"}[
+                max(blocked, key=blocked.get)]
+        out.append({"class_id": c, "subject_id": s, "teacher_id": t, "session": k,
+                    "reason": reason, "detail": REASONS[reason], "blocked_slots": blocked})
+    return out
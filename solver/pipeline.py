@@ -0,0 +1,367 @@
+import hashlib
+import multiprocessing as mp
+import os
+import time
+from datetime import datetime, timezone
+from functools import partial
+from sqlalchemy import insert, update
+from sqlmodel import delete, select
+try:
+    from .. import cache
+    from ..db import get_session
+    from ..models import Assignment, Timetable, TimetableGrid
+    from .csp import CSP
+    from .bitset import BitsetCSP, VALUE_ORDERS
+    from .twostage import TwoStage
+    from .build_problem import load_context, build_neighbors, consistent_factory, Rules
+    from .repair import seed_from_previous, min_conflicts
+    from .portfolio import run_restarts, solve_portfolio
+    from .grids import save_grids
+    from .compiled import get_problem
+    from .partial import fill, explain
+except ImportError:
+    import cache
+    from db import get_session
+    from models import Assignment, Timetable, TimetableGrid
+    from solver.csp import CSP
+    from solver.bitset import BitsetCSP, VALUE_ORDERS
+    from solver.twostage import TwoStage
+    from solver.build_problem import load_context, build_neighbors, consistent_factory, Rules
+    from solver.repair import seed_from_previous, min_conflicts
+    from solver.portfolio import run_restarts, solve_portfolio
+    from solver.grids import save_grids
+    from solver.compiled import get_problem
+    from solver.partial import fill, explain
+
+# worker processes used to search independent components in parallel
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(os.cpu_count() or 1)))
+# saved timetables kept besides the active one, for inspection or rollback
+KEEP_TIMETABLES = int(os.getenv("KEEP_TIMETABLES", "5"))
+# below this many sessions, starting processes costs more than it saves
+PARALLEL_MIN_SESSIONS = 500
+
+ENGINES = ("bitset", "classic", "twostage")
+MODES = ("full", "repair")
+
+def check_options(engine="bitset", value_order="lcv", mode="full", workers=None, portfolio=0, decompose=False,
+                  time_limit=None, node_limit=None):
+    if engine not in ENGINES:
+        raise ValueError("engine must be 'bitset', 'classic' or 'twostage'")
+    if mode not in MODES:
+        raise ValueError("mode must be 'full' or 'repair'")
+    if value_order not in VALUE_ORDERS or (engine == "classic" and value_order == "approx"):
+        raise ValueError("value_order must be 'lcv', 'approx' or 'none' ('approx' needs engine=bitset or twostage)")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+    if portfolio < 0:
+        raise ValueError("portfolio must be 0 (off) or the number of parallel runs")
+    if portfolio and decompose:
+        raise ValueError("portfolio and decompose cannot be combined")
+    if time_limit is not None and time_limit <= 0:
+        raise ValueError("time_limit must be positive")
+    if node_limit is not None and node_limit < 1:
+        raise ValueError("node_limit must be at least 1")
+
+def active_timetable_id(s):
+    # None for databases that predate timetable versions: their assignments
+    # have no timetable_id and are still the ones to show
+    return s.exec(select(Timetable.id).where(Timetable.is_active == True)).first()
+
+def load_previous():
+    with get_session() as s:
+        q = select(Assignment.class_id, Assignment.subject_id, Assignment.teacher_id,
+                   Assignment.timeslot_id, Assignment.room_id, Assignment.is_double)
+        return s.exec(q.where(Assignment.timetable_id == active_timetable_id(s))).all()
+
+def make_csp(engine, value_order, ctx, variables, domains, seed=None):
+    rules = Rules(ctx)
+    if engine == "bitset":
+        return BitsetCSP(variables, domains, slot_ids=[t.id for t in ctx["slot_list"]], value_order=value_order,
+                         seed=seed, rules=rules)
+    if engine == "twostage":
+        return TwoStage(variables, domains, [t.id for t in ctx["slot_list"]], value_order=value_order, seed=seed,
+                        rules=rules)
+    neighbors = build_neighbors(variables, domains)
+    consistent = consistent_factory(ctx)
+    return CSP(variables, domains, neighbors, consistent, value_order=value_order, seed=seed, load=rules.load)
+
+STAT_KEYS = ("nodes", "backtracks", "pruned", "max_depth")
+
+def add_stats(total, stats):
+    for key in STAT_KEYS:
+        total[key] = max(total.get(key, 0), stats[key]) if key == "max_depth" else total.get(key, 0) + stats[key]
+    return total
+
+def search(engine, value_order, ctx, variables, domains, seed=None, node_limit=None, deadline=None):
+    # One search; with a seed, randomized restarts that the seed reproduces.
+    # -> (assignment or None, search stats, restart info or None, best
+    # partial assignment when a node_limit/deadline stopped it early)
+    if seed is None:
+        csp = make_csp(engine, value_order, ctx, variables, domains)
+        return csp.backtrack(node_limit, deadline), csp.stats(), None, csp.best_partial()
+    make = partial(make_csp, engine, value_order, ctx, variables, domains)
+    assignment, info, best = run_restarts(make, len(variables), seed, node_limit=node_limit, deadline=deadline)
+    return assignment, add_stats({}, info), info, best
+
+def _search_part(args):
+    assignment, stats, _, best = search(*args)
+    return assignment, stats, best
+
+def search_parts(engine, value_order, ctx, parts, domains, workers=None, seed=None, node_limit=None, deadline=None):
+    # Search independent components across a process pool and merge the
+    # results.  Without limits the first infeasible component stops all the
+    # others; with a node_limit (per component) or deadline every component
+    # runs and their best partial assignments are merged.
+    # -> (assignment or None, search stats summed over the parts searched, partial)
+    limited = node_limit is not None or deadline is not None
+    workers = min(workers or SEARCH_WORKERS, len(parts))
+    jobs = [(engine, value_order, ctx, part, {v: domains[v] for v in part}, seed, node_limit, deadline)
+            for part in parts]
+    if sum(len(part) for part in parts) < PARALLEL_MIN_SESSIONS:
+        workers = 1
+    pool = mp.get_context("spawn").Pool(workers) if workers > 1 else None
+    results = pool.imap_unordered(_search_part, jobs) if pool else map(_search_part, jobs)
+    try:
+        merged, stats, best, complete = {}, {}, {}, True
+        for res, part_stats, part_best in results:
+            add_stats(stats, part_stats)
+            if not res:
+                if not limited:
+                    return None, stats, {}
+                complete = False
+                best.update(part_best)
+                continue
+            merged.update(res)
+            best.update(res)
+        return (merged if complete else None), stats, best
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def portfolio_configs(engine, value_order, runs):
+    # the requested ordering first, then the engine's other orderings in turn
+    orders = [o for o in VALUE_ORDERS if engine != "classic" or o != "approx"]
+    orders = [value_order] + [o for o in orders if o != value_order]
+    return [{"engine": engine, "value_order": orders[j % len(orders)]} for j in range(runs)]
+
+def solve_problem(engine="bitset", value_order="lcv", mode="full", decompose=False, workers=None,
+                  seed=None, portfolio=0, time_limit=None, node_limit=None, progress=None):
+    # Load, build and search; no DB writes, so it can run in a worker process.
+    # progress(phase) is called as each phase starts.  mode="repair" starts
+    # from the saved timetable and falls back to a full search if local
+    # search cannot fix it.  decompose=True searches independent components
+    # in parallel on up to `workers` processes.  A seed switches to
+    # randomized restarts; portfolio=N races N of them (seeds seed, seed+1,
+    # ...) and keeps the first timetable found.  The result reports the wall
+    # time of each phase ("timings") and the search statistics ("search").
+    #
+    # time_limit (seconds for the whole solve) and node_limit (values tried,
+    # per run or component) make it an anytime solve: when the search stops
+    # without a full timetable the result has status "partial", the most
+    # complete assignment found plus whatever else still fits, and
+    # "unplaced" with the constraint blocking each remaining session.
+    #
+    # Before searching, root propagation (propagate.reduce) shrinks the
+    # domains; when it proves the input infeasible the result says why
+    # ("reason") without any search, unless a limit asks for the best
+    # partial timetable anyway.
+    check_options(engine, value_order, mode, workers, portfolio, decompose, time_limit, node_limit)
+    report = _Phases(progress)
+    limited = time_limit is not None or node_limit is not None
+    deadline = time.time() + time_limit if time_limit is not None else None
+
+    report("load")
+    ctx = load_context()
+    previous = load_previous() if mode == "repair" else None
+    report("build")
+    problem, compiled = get_problem(ctx)
+    ctx, variables, domains, slot_ids, rules = (problem.ctx, problem.variables, problem.domains,
+                                                problem.slot_ids, problem.rules)
+    # the options that decide which timetable a full solve finds; an unseeded
+    # portfolio draws its seeds when it starts, so no options decide it
+    replayable = mode != "repair" and not (portfolio and seed is None)
+    key = (engine, value_order, decompose, seed, portfolio) if replayable else None
+    fingerprint = hashlib.sha1(f"{problem.fingerprint}:{key}".encode()).hexdigest() if key else None
+    cache_info = {"problem": compiled, "solution": False}
+
+    cached = problem.solution(key) if key else None
+    if cached is not None and (cached[0] == "feasible" or not limited):
+        status, assignment, reason = cached
+        result = {"status": status, "assignment": dict(assignment) if assignment else None,
+                  "doubles": rules.doubles_of(assignment or {}), "variables": len(variables),
+                  "fingerprint": fingerprint, "cache": dict(cache_info, solution=True), "timings": report.stop()}
+        if reason is not None:
+            result["reason"] = reason
+        return result
+
+    report("propagate")
+    reduced, propagation, reason = problem.reduced()
+    if reason is not None and not limited:
+        if key is not None:
+            problem.remember(key, "infeasible", None, reason)
+        return {"status": "infeasible", "assignment": None, "doubles": {}, "variables": len(variables),
+                "fingerprint": fingerprint, "reason": reason, "cache": cache_info, "timings": report.stop()}
+    domains = reduced
+
+    if mode == "repair":
+        report("repair")
+        start = seed_from_previous(variables, domains, previous, slot_ids, rules)
+        assignment, stats = min_conflicts(variables, domains, start, slot_ids, rules=rules)
+        if assignment is not None:
+            return {"status": "feasible", "assignment": assignment, "doubles": rules.doubles_of(assignment),
+                    "variables": len(variables), "repair": stats, "cache": cache_info, "timings": report.stop()}
+
+    parts = problem.parts() if decompose else [variables]
+    report("search")
+    extra = {}
+    if portfolio:
+        make_for = lambda config: partial(make_csp, config["engine"], config["value_order"], ctx, variables, domains)
+        assignment, extra["portfolio"], best = solve_portfolio(make_for, len(variables),
+                                                               portfolio_configs(engine, value_order, portfolio),
+                                                               seed, node_limit, deadline)
+        winner = extra["portfolio"]["winner"]
+        search_stats = add_stats({}, winner) if winner and "nodes" in winner else None
+    elif len(parts) > 1:
+        assignment, search_stats, best = search_parts(engine, value_order, ctx, parts, domains, workers, seed,
+                                                      node_limit, deadline)
+    else:
+        assignment, search_stats, restarts, best = search(engine, value_order, ctx, variables, domains, seed,
+                                                          node_limit, deadline)
+        if restarts is not None:
+            extra["restarts"] = restarts
+    status = "feasible" if assignment else "infeasible"
+    if not assignment and limited:
+        assignment = fill(variables, domains, best, rules)
+        if len(assignment) == len(variables):
+            status = "feasible"
+        else:
+            status = "partial"
+            fingerprint = None  # depends on where the limit struck, not only on the options
+            extra["placed"] = len(assignment)
+            extra["unplaced"] = explain(variables, domains, assignment, rules)
+    if reason is not None:
+        extra["reason"] = reason
+    report.stop()
+    result = {
+        "status": status,
+        "assignment": assignment,
+        "doubles": rules.doubles_of(assignment or {}),
+        "variables": len(variables),
+        "fingerprint": fingerprint,
+        "cache": cache_info,
+        "search": search_stats,
+        "propagation": propagation,
+        "timings": report.seconds,
+        **extra,
+    }
+    if key is not None and status != "partial":
+        problem.remember(key, status, assignment, reason)
+    if decompose:
+        result["components"] = len(parts)
+    if mode == "repair":
+        result["repair"] = dict(stats, fallback="full")
+    return result
+
+class _Phases:
+    # progress callback that also accumulates the wall time of each phase
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.seconds = {}
+        self.current = None
+        self.started = 0.0
+
+    def __call__(self, phase):
+        self.stop()
+        self.current, self.started = phase, time.perf_counter()
+        if self.progress:
+            self.progress(phase)
+
+    def stop(self):
+        if self.current is not None:
+            spent = self.seconds.get(self.current, 0.0) + time.perf_counter() - self.started
+            self.seconds[self.current] = round(spent, 4)
+            self.current = None
+        return self.seconds
+
+def save_result(result) -> dict:
+    # Persist a solve_problem result (popping its assignment) and add the
+    # "persist" timing.  A solve that repeats the one behind the active
+    # timetable, same input data and same options, keeps that version
+    # instead of saving a copy.  Partial timetables are saved with status
+    # "partial" so planners can place the rest by hand; they become active
+    # only if the active one is partial too, else activate_timetable does it.
+    started = time.perf_counter()
+    try:
+        return _save(result)
+    finally:
+        result.setdefault("timings", {})["persist"] = round(time.perf_counter() - started, 4)
+
+def _save(result):
+    assignment = result.pop("assignment")
+    doubles = result.pop("doubles", None)
+    if not assignment:
+        return {"saved": 0}
+    fingerprint = result.get("fingerprint")
+    if fingerprint:
+        with get_session() as s:
+            active = s.exec(select(Timetable).where(Timetable.is_active == True)).first()
+            if active is not None and active.fingerprint == fingerprint:
+                return {"timetable_id": active.id, "saved": 0, "reused": True}
+    return persist_assignment(assignment, status=result.get("status", "feasible"), fingerprint=fingerprint,
+                              doubles=doubles)
+
+def persist_assignment(assignment, status="feasible", fingerprint=None, doubles=None) -> dict:
+    # Write a new timetable version and make it the active one in a single
+    # transaction: readers see the previous version until the commit and
+    # never an empty table.  A partial version does not replace a complete
+    # active one; it is kept beside it.  The class/teacher/room grids are rendered here
+    # too, so reading them later is a lookup.  doubles maps each double
+    # period to its second slot; both slots get a row with is_double set.
+    now = datetime.now(timezone.utc)
+    doubles = doubles or {}
+    rows = []
+    for v, (slot_id, room_id) in assignment.items():
+        c_id, s_id, t_id, _ = v
+        for sl in (slot_id, doubles[v]) if v in doubles else (slot_id,):
+            rows.append({"class_id": c_id, "subject_id": s_id, "teacher_id": t_id, "room_id": room_id,
+                         "timeslot_id": sl, "is_double": v in doubles, "created_at": now})
+    with get_session() as s:
+        tt = Timetable(status=status, sessions=len(rows), fingerprint=fingerprint, created_at=now)
+        s.add(tt)
+        s.flush()
+        for row in rows:
+            row["timetable_id"] = tt.id
+        saved = s.execute(insert(Assignment.__table__), rows).rowcount if rows else 0
+        if saved < 0:  # driver did not report a count for executemany
+            saved = len(rows)
+        save_grids(s, tt.id, rows)
+        active = s.exec(select(Timetable).where(Timetable.is_active == True)).first()
+        activate = status != "partial" or active is None or active.status == "partial"
+        if activate:
+            s.execute(update(Timetable).values(is_active=(Timetable.id == tt.id)))
+        _drop_old_timetables(s, {tt.id} if activate else {tt.id, active.id})
+        s.commit()
+        cache.invalidate()
+        return {"timetable_id": tt.id, "saved": saved, "active": activate}
+
+def _drop_old_timetables(s, keep):
+    ids = s.exec(select(Timetable.id).where(Timetable.id.not_in(keep)).order_by(Timetable.id.desc())).all()
+    old = ids[KEEP_TIMETABLES:]
+    s.exec(delete(Assignment).where(Assignment.timetable_id == None))
+    if old:
+        s.exec(delete(Assignment).where(Assignment.timetable_id.in_(old)))
+        s.exec(delete(TimetableGrid).where(TimetableGrid.timetable_id.in_(old)))
+        s.exec(delete(Timetable).where(Timetable.id.in_(old)))
+
+def list_timetables():
+    with get_session() as s:
+        return s.exec(select(Timetable).order_by(Timetable.id.desc())).all()
+
+def activate_timetable(timetable_id) -> bool:
+    with get_session() as s:
+        if s.get(Timetable, timetable_id) is None:
+            return False
+        s.execute(update(Timetable).values(is_active=(Timetable.id == timetable_id)))
+        s.commit()
+        cache.invalidate()
+        return True
@@ -0,0 +1,130 @@
+import multiprocessing as mp
+import queue
+import random
+import time
+
+# Randomized restarts and a parallel portfolio of them.
+#
+# A single run restarts its search with a fresh seed whenever it exceeds a
+# node cutoff that grows along the Luby sequence (1, 1, 2, 1, 1, 2, 4, ...)
+# times a base proportional to the number of sessions, so an unlucky early
+# choice costs a bounded amount of work.  Everything is derived from the
+# run's seed, so the same seed and options reproduce the same timetable.
+#
+# A portfolio starts several such runs with different seeds and value
+# orderings in separate processes; the first timetable found wins and the
+# other runs are terminated.
+
+RESTART_BASE = 100
+# seconds a portfolio waits past its deadline for runs to report
+STOP_GRACE = 2.0
+# seconds between checks that the runs are still alive
+POLL = 0.1
+
+
+def luby(i: int) -> int:
+    # i-th term (1-based) of the Luby sequence
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while True:
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+
+
+def run_restarts(make_csp, n_variables, seed, stop=None, max_restarts=None, node_limit=None, deadline=None):
+    # make_csp(seed) -> fresh engine.  Returns (assignment or None, info,
+    # best partial assignment); info holds the search stats summed over all
+    # restarts.  node_limit caps the nodes of all restarts together and
+    # deadline (a time.time() value) stops the last one early.
+    rnd = random.Random(seed)
+    base = n_variables + RESTART_BASE
+    stats = {"nodes": 0, "backtracks": 0, "pruned": 0, "max_depth": 0}
+    best = {}
+    i = 0
+    while max_restarts is None or i < max_restarts:
+        if (stop is not None and stop.is_set()) or (deadline is not None and time.time() >= deadline):
+            break
+        cutoff = luby(i + 1) * base
+        if node_limit is not None:
+            if stats["nodes"] >= node_limit:
+                break
+            cutoff = min(cutoff, node_limit - stats["nodes"])
+        i += 1
+        csp = make_csp(rnd.randrange(1 << 31))
+        result = csp.backtrack(node_limit=cutoff, deadline=deadline)
+        for key, value in csp.stats().items():
+            stats[key] = max(stats[key], value) if key == "max_depth" else stats[key] + value
+        if result or not csp.stopped:
+            # a solution, or a search that ran to the end and proved there is none
+            return result, {"seed": seed, "restarts": i - 1, **stats, "exhausted": not result}, csp.best_partial()
+        partial = csp.best_partial()
+        if len(partial) > len(best):
+            best = partial
+    return None, {"seed": seed, "restarts": i, **stats, "exhausted": False}, best
+
+
+def _portfolio_worker(make_csp, n_variables, seed, config, stop, out, node_limit=None, deadline=None):
+    try:
+        result, info, partial = run_restarts(make_csp, n_variables, seed, stop=stop,
+                                             node_limit=node_limit, deadline=deadline)
+        out.put((dict(info, **config), result, partial))
+    except Exception as e:
+        out.put((dict(config, seed=seed, error=f"{type(e).__name__}: {e}"), None, {}))
+
+
+def solve_portfolio(make_csp_for, n_variables, configs, seed=None, node_limit=None, deadline=None):
+    # make_csp_for(config) must return a picklable make_csp(seed) callable.
+    # configs: one dict of engine options per run.  node_limit and deadline
+    # apply to each run.  Returns (assignment or None, {"runs": [...],
+    # "winner": info or None}, best partial assignment of any run).
+    if seed is None:
+        seed = random.randrange(1 << 31)
+    ctx = mp.get_context("spawn")
+    stop, out = ctx.Event(), ctx.Queue()
+    procs = []
+    for j, config in enumerate(configs):
+        p = ctx.Process(target=_portfolio_worker,
+                        args=(make_csp_for(config), n_variables, seed + j, config, stop, out, node_limit, deadline),
+                        daemon=True)
+        p.start()
+        procs.append(p)
+
+    runs, winner, assignment, best = [], None, None, {}
+    exited = False
+    try:
+        while len(runs) < len(procs):
+            try:
+                info, result, partial = out.get(timeout=POLL)
+            except queue.Empty:
+                # runs stop themselves at the deadline; allow a moment to report
+                if deadline is not None and time.time() >= deadline + STOP_GRACE:
+                    break
+                # a run killed without reporting (out of memory, a signal)
+                # never will: stop once every run has exited and a whole
+                # poll after that brought nothing
+                if any(p.is_alive() for p in procs):
+                    continue
+                if exited:
+                    break
+                exited = True
+                continue
+            exited = False
+            runs.append(info)
+            if len(partial) > len(best):
+                best = partial
+            if result or info.get("exhausted"):
+                # first timetable wins; a complete search proves there is none
+                winner, assignment = info, result
+                break
+    finally:
+        stop.set()
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=1)
+    return assignment, {"base_seed": seed, "runs": runs, "winner": winner}, best
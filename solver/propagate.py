@@ -0,0 +1,284 @@
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+# Root propagation, run once on the compiled domains before any search.
+#
+#   counting  a teacher or class needing more periods than the slots open to
+#             its sessions, or a pool of sessions needing more room-periods
+#             than their candidate rooms have, is infeasible outright
+#   AC-3      arc consistency for the binary constraints: a session whose
+#             every value covers slot x takes x away from the other sessions
+#             of its teacher and class (and, with a single candidate room,
+#             from that room)
+#   alldiff   the sessions of a teacher, and of a class, need pairwise
+#             different start slots: a matching of sessions to slots must
+#             exist, and a slot that no maximum matching gives a session is
+#             removed from it (Regin's filtering)
+#
+# The passes repeat until nothing changes.  Only values that are in no
+# timetable are removed, so every engine can search the reduced domains.  The
+# slot order the engines keep between sessions of one ClassSubject is
+# symmetry breaking, not a constraint, and is left to them: trimming the
+# first and last slots off those sessions here removes no conflict and only
+# skews the engines' most-constrained-first choice.
+# An empty domain or a failed check raises Infeasible with the reason, which
+# answers the solve without searching at all.
+
+Var = Tuple[int, int, int, int]
+
+
+class Infeasible(Exception):
+    def __init__(self, reason: str, detail: str, **where):
+        super().__init__(detail)
+        self.info = {"reason": reason, "detail": detail, **where}
+
+
+class _Memo:
+    # per-domain summaries; domains are tuples shared between sessions, so
+    # they are keyed by identity and checked against the tuple still held
+    def __init__(self, fn):
+        self.fn = fn
+        self.cache = {}
+
+    def __call__(self, key, vals):
+        hit = self.cache.get((key, id(vals)))
+        if hit is None or hit[0] is not vals:
+            hit = self.cache[(key, id(vals))] = (vals, self.fn(key, vals))
+        return hit[1]
+
+
+def reduce(variables, domains, rules, names=None) -> Tuple[Dict[Var, tuple], dict]:
+    # -> (reduced domains, {"pruned": values removed, "rounds", "seconds"}).
+    # names: optional {"teacher": {id: name}, "class": ..., "subject": ...,
+    # "room": ...} for readable reasons.  Domains that lose nothing stay the
+    # same shared tuple objects.
+    started = time.perf_counter()
+    names = names or {}
+    label = lambda kind, x: names.get(kind, {}).get(x, x)
+    dom = {v: domains[v] for v in variables}
+    span = {v: rules.span(v) for v in variables}
+
+    covers = {}
+    def cover(sp, sl):
+        c = covers.get((sp, sl))
+        if c is None:
+            c = covers[(sp, sl)] = frozenset(rules.slots(sp, sl))
+        return c
+
+    starts = _Memo(lambda sp, vals: frozenset(sl for sl, _ in vals))
+    covered = _Memo(lambda sp, vals: frozenset().union(*(cover(sp, sl) for sl in starts(sp, vals))))
+    # slots that every value of a domain covers
+    taken = _Memo(lambda sp, vals: frozenset.intersection(*(cover(sp, sl) for sl in starts(sp, vals))))
+    rooms = _Memo(lambda sp, vals: frozenset(r for _, r in vals))
+
+    def session(v):
+        return f"{label('class', v[0])} / {label('subject', v[1])} (session {v[3]})"
+
+    def where(v):
+        c, s, t, k = v
+        return {"class_id": c, "subject_id": s, "teacher_id": t, "session": k}
+
+    for v in variables:
+        if not dom[v]:
+            raise Infeasible("no_values", f"{session(v)} has no slot and room: no room of its type and size "
+                             f"in a slot its teacher is available", **where(v))
+
+    by_teacher, by_class, by_room = {}, {}, {}
+    for v in variables:
+        c, s, t, k = v
+        by_teacher.setdefault(t, []).append(v)
+        by_class.setdefault(c, []).append(v)
+        for r in rooms(span[v], dom[v]):
+            by_room.setdefault(r, []).append(v)
+
+    # room pools: sessions whose candidate rooms all lie within a room set R
+    # need no more periods than R offers in the slots they can use
+    pools = {}
+    for v in variables:
+        pools.setdefault(rooms(span[v], dom[v]), []).append(v)
+    for pool in pools:
+        inside = [v for other, vs in pools.items() if other <= pool for v in vs]
+        need = sum(span[v] for v in inside)
+        have = len(pool) * len(frozenset().union(*(covered(span[v], dom[v]) for v in inside)))
+        if need > have:
+            room_names = ", ".join(str(label("room", r)) for r in sorted(pool))
+            raise Infeasible("rooms_overbooked", f"sessions that can only use {room_names} need {need} periods; "
+                             f"those rooms have {have} in the slots open to them", room_ids=sorted(pool))
+
+    stats = {"pruned": 0, "rounds": 0}
+    queue, queued = deque(variables), set(variables)
+    dirty = {("teacher", t) for t in by_teacher} | {("class", c) for c in by_class}
+
+    def prune(v, keep, cause):
+        old = dom[v]
+        new = tuple(val for val in old if keep(val))
+        if len(new) == len(old):
+            return
+        if not new:
+            raise Infeasible("conflict", f"{session(v)} has no value left: {cause}", **where(v))
+        stats["pruned"] += len(old) - len(new)
+        dom[v] = new
+        if v not in queued:
+            queue.append(v)
+            queued.add(v)
+        dirty.add(("teacher", v[2]))
+        dirty.add(("class", v[0]))
+
+    def clear_of(v, busy, room=None):
+        # keep values of v that stay off the busy slots (in room, if given)
+        sp = span[v]
+        return lambda val: (room is not None and val[1] != room) or not cover(sp, val[0]) & busy
+
+    while queue or dirty:
+        stats["rounds"] += 1
+        while queue:
+            u = queue.popleft()
+            queued.discard(u)
+            busy = taken(span[u], dom[u])
+            if busy:
+                c, s, t, k = u
+                for v in by_teacher[t]:
+                    if v != u:
+                        prune(v, clear_of(v, busy), f"{label('teacher', t)} must teach {session(u)} then")
+                for v in by_class[c]:
+                    if v != u:
+                        prune(v, clear_of(v, busy), f"{label('class', c)} must have {session(u)} then")
+                only = rooms(span[u], dom[u])
+                if len(only) == 1:
+                    (r,) = only
+                    for v in by_room.get(r, ()):
+                        if v != u:
+                            prune(v, clear_of(v, busy, r), f"{label('room', r)} is needed for {session(u)} then")
+        if dirty:
+            kind, key = dirty.pop()
+            group = by_teacher[key] if kind == "teacher" else by_class[key]
+            _alldiff(group, dom, span, starts, covered, prune, kind, label(kind, key), key)
+
+    stats["seconds"] = round(time.perf_counter() - started, 4)
+    return dom, stats
+
+
+def _alldiff(group, dom, span, starts, covered, prune, kind, who, key):
+    # the sessions of one teacher or class: enough periods, a matching of
+    # sessions to distinct start slots, and no start outside every maximum
+    # matching
+    reason = f"{kind}_overbooked"
+    ident = {f"{kind}_id": key}
+    need = sum(span[v] for v in group)
+    have = len(frozenset().union(*(covered(span[v], dom[v]) for v in group)))
+    if need > have:
+        raise Infeasible(reason, f"{who} needs {need} periods but only {have} slots are open to them", **ident)
+    edges = {v: starts(span[v], dom[v]) for v in group}
+    match = _matching(edges)
+    if len(match) < len(group):
+        raise Infeasible(reason, f"{who} has {len(group)} sessions but at most {len(match)} of them fit "
+                         f"in different slots", **ident)
+    allowed = _regin(edges, match)
+    for v in group:
+        if len(allowed[v]) < len(edges[v]):
+            keep = allowed[v]
+            prune(v, lambda val, keep=keep: val[0] in keep,
+                  f"the other sessions of {who} need every slot it could take")
+
+
+def _matching(edges) -> Dict[object, object]:
+    # maximum bipartite matching var -> slot by augmenting paths (groups are
+    # a teacher's or class's sessions, a few dozen at most)
+    match_v, match_s = {}, {}
+    for root in sorted(edges, key=lambda v: len(edges[v])):
+        # iterative DFS for an augmenting path from root
+        parent, seen = {}, set()
+        stack = [(root, iter(edges[root]))]
+        end = None
+        while stack and end is None:
+            v, it = stack[-1]
+            for s in it:
+                if s in seen:
+                    continue
+                seen.add(s)
+                parent[s] = v
+                if s not in match_s:
+                    end = s
+                    break
+                stack.append((match_s[s], iter(edges[match_s[s]])))
+                break
+            else:
+                stack.pop()
+        s = end
+        while s is not None:
+            v = parent[s]
+            prev = match_v.get(v)
+            match_v[v], match_s[s] = s, v
+            s = prev if v != root else None
+    return match_v
+
+
+def _regin(edges, match) -> Dict[object, set]:
+    # start slots of each var that belong to some maximum matching: its
+    # matched slot, slots on an even alternating path to a free slot, and
+    # slots in the var's strongly connected component of the graph with
+    # unmatched edges var -> slot and matched edges slot -> var
+    match_s = {s: v for v, s in match.items()}
+    slots = set().union(*edges.values())
+    # slots that reach a free slot: walk back from the free ones
+    reach = {s for s in slots if s not in match_s}
+    back = {}
+    for v, ss in edges.items():
+        for s in ss:
+            if match[v] != s:
+                back.setdefault(s, []).append(v)
+    todo = list(reach)
+    while todo:
+        s = todo.pop()
+        for v in back.get(s, ()):
+            m = match[v]
+            if m not in reach:
+                reach.add(m)
+                todo.append(m)
+
+    graph = {("v", v): [("s", s) for s in ss if s != match[v]] for v, ss in edges.items()}
+    for s in slots:
+        graph[("s", s)] = [("v", match_s[s])] if s in match_s else []
+    comp = _scc(graph)
+    return {v: {s for s in ss if s == match[v] or s in reach or comp[("s", s)] == comp[("v", v)]}
+            for v, ss in edges.items()}
+
+
+def _scc(graph) -> Dict[object, int]:
+    # iterative Tarjan: node -> component number
+    index, low, comp, on_stack, stack = {}, {}, {}, set(), []
+    counter = 0
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, it = work[-1]
+            for nxt in it:
+                if nxt not in index:
+                    index[nxt] = low[nxt] = counter
+                    counter += 1
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(graph[nxt])))
+                    break
+                if nxt in on_stack:
+                    low[node] = min(low[node], index[nxt])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        x = stack.pop()
+                        on_stack.discard(x)
+                        comp[x] = index[node]
+                        if x == node:
+                            break
+    return comp
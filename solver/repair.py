@@ -0,0 +1,174 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+# Repair an existing timetable after small edits instead of solving from
+# scratch.  The previous Assignment rows seed every session they still fit;
+# only sessions that are new, lost their slot/room, or clash with a kept
+# session start unassigned.  Min-conflicts local search then places those,
+# moving already-placed sessions only when a clash forces it.
+#
+# Double periods (rules.span(v) == 2) clash on both of their slots.  A
+# teacher's daily limit is a conflict too: every period past it on a day
+# counts as one, and the sessions on that day are conflicted until one moves.
+
+Var = Tuple[int, int, int, int]
+
+
+def seed_from_previous(variables, domains, rows, slot_ids, rules=None) -> Dict[Var, Tuple[int, int]]:
+    # rows: (class_id, subject_id, teacher_id, timeslot_id, room_id,
+    # is_double).  The sessions of a ClassSubject are interchangeable, so
+    # previous rows are matched to session k in slot order, doubles to the
+    # double sessions by their first slot.
+    slot_pos = {sl: i for i, sl in enumerate(slot_ids)}
+    previous = {}
+    for c, s, t, slot_id, room_id, *double in rows:
+        if slot_id in slot_pos:
+            previous.setdefault((c, s, t, bool(double and double[0])), []).append((slot_id, room_id))
+    for (_, _, _, double), vals in previous.items():
+        vals.sort(key=lambda val: slot_pos[val[0]])
+        if double:
+            # the two rows of a double period: keep the first of each pair
+            vals[:] = vals[::2]
+
+    allowed = {}  # one set per shared domain object
+    start, used = {}, set()
+    for v in sorted(variables, key=lambda v: v[3]):
+        double = rules is not None and rules.span(v) == 2
+        k = v[3] - (0 if double or rules is None else rules.doubles.get(v[:3], 0))
+        vals = previous.get(v[:3] + (double,))
+        if not vals or k >= len(vals):
+            continue
+        val = vals[k]
+        dom = allowed.get(id(domains[v]))
+        if dom is None:
+            dom = allowed[id(domains[v])] = set(domains[v])
+        keys = _keys(v, val, rules)
+        if val not in dom or used.intersection(keys):
+            continue
+        start[v] = val
+        used.update(keys)
+    return start
+
+
+def min_conflicts(variables, domains, start, slot_ids, max_steps=None, seed=0,
+                  rules=None) -> Tuple[Optional[Dict[Var, Tuple[int, int]]], dict]:
+    rnd = random.Random(seed)
+    keys_of = lambda v, val: _keys(v, val, rules)
+    variables = list(variables)
+    load_of = (lambda v, val: rules.load(v, val)) if rules is not None else (lambda v, val: [])
+    occupants: Dict[tuple, set] = {}
+    current: Dict[Var, Tuple[int, int]] = {}
+    on_day: Dict[tuple, set] = {}  # (teacher_id, day) -> sessions there
+    used: Dict[tuple, int] = {}    # (teacher_id, day) -> periods taught
+
+    def place(v, val):
+        current[v] = val
+        for key in keys_of(v, val):
+            occupants.setdefault(key, set()).add(v)
+        for key, n, _ in load_of(v, val):
+            on_day.setdefault(key, set()).add(v)
+            used[key] = used.get(key, 0) + n
+
+    def unplace(v):
+        val = current.pop(v)
+        for key in keys_of(v, val):
+            occupants[key].discard(v)
+        for key, n, _ in load_of(v, val):
+            on_day[key].discard(v)
+            used[key] -= n
+
+    def conflicts(v, val):
+        c = sum(len(occupants.get(key, ())) - (v in occupants.get(key, ())) for key in keys_of(v, val))
+        for key, n, cap in load_of(v, val):
+            # periods past the limit with v there (and not counted twice)
+            have = used.get(key, 0) - (n if v in on_day.get(key, ()) else 0)
+            c += max(0, have + n - cap)
+        return c
+
+    def best_value(v):
+        best, best_vals = None, []
+        for val in domains[v]:
+            c = conflicts(v, val)
+            if best is None or c < best:
+                best, best_vals = c, [val]
+            elif c == best:
+                best_vals.append(val)
+        if v in current and current[v] in best_vals:
+            return current[v]  # stay put when moving does not help
+        return rnd.choice(best_vals)
+
+    def clashing(v):
+        val = current[v]
+        return (any(len(occupants[key]) > 1 for key in keys_of(v, val))
+                or any(used[key] > cap for key, _, cap in load_of(v, val)))
+
+    for v, val in start.items():
+        place(v, val)
+    todo = [v for v in variables if v not in current]
+    if any(not domains[v] for v in todo):
+        return None, {"kept": len(start), "unassigned": len(todo), "moved": 0, "steps": 0}
+    # most constrained first, each into its least-conflicting value
+    todo.sort(key=lambda v: len(domains[v]))
+    for v in todo:
+        place(v, best_value(v))
+
+    conflicted = {v for v in current if clashing(v)}
+    if max_steps is None:
+        max_steps = 1000 + 100 * len(todo)
+    steps = 0
+    while conflicted and steps < max_steps:
+        steps += 1
+        # prefer moving sessions that were not kept from the previous timetable
+        fresh = [v for v in conflicted if v not in start or current[v] != start[v]]
+        v = rnd.choice(fresh or list(conflicted))
+        val = best_value(v)
+        if val == current[v]:
+            # a plateau: take a random value to escape
+            val = rnd.choice(domains[v])
+        old = current[v]
+        touched = set()
+        for key in keys_of(v, old) + keys_of(v, val):
+            touched.update(occupants.get(key, ()))
+        for key, _, _ in load_of(v, old) + load_of(v, val):
+            touched.update(on_day.get(key, ()))
+        unplace(v)
+        place(v, val)
+        touched.add(v)
+        for u in touched:
+            if clashing(u):
+                conflicted.add(u)
+            else:
+                conflicted.discard(u)
+
+    stats = {
+        "kept": sum(1 for v, val in start.items() if current.get(v) == val),
+        "unassigned": len(todo),
+        "moved": sum(1 for v, val in start.items() if current.get(v) != val),
+        "steps": steps,
+    }
+    if conflicted:
+        return None, stats
+    return _in_slot_order(current, slot_ids, rules), stats
+
+
+def _keys(v, val, rules=None) -> List[tuple]:
+    c, s, t, k = v
+    slot_id, room_id = val
+    slots = rules.cover(v, slot_id) if rules is not None else (slot_id,)
+    return [key for sl in slots for key in (("t", t, sl), ("c", c, sl), ("r", room_id, sl))]
+
+
+def _in_slot_order(assignment, slot_ids, rules=None):
+    # relabel each ClassSubject's sessions so k follows slot order, the same
+    # order the search engines produce
+    slot_pos = {sl: i for i, sl in enumerate(slot_ids)}
+    by_map: Dict[tuple, List[Var]] = {}
+    for v in assignment:
+        span = rules.span(v) if rules is not None else 1
+        by_map.setdefault(v[:3] + (span,), []).append(v)
+    out = {}
+    for vs in by_map.values():
+        vs.sort(key=lambda v: v[3])
+        vals = sorted((assignment[v] for v in vs), key=lambda val: slot_pos[val[0]])
+        out.update(zip(vs, vals))
+    return out
@@ -0,0 +1,243 @@
+from collections import deque
+from typing import Dict, List, Tuple
+try:
+    from .bitset import BitsetCSP
+except ImportError:
+    from solver.bitset import BitsetCSP
+
+# Two-stage search (engine="twostage").  Rooms of the same type and size are
+# interchangeable, yet a (slot, room) domain makes the search branch over
+# them.  Here the search assigns timeslots only, then gives each slot's
+# sessions their rooms with a bipartite matching.
+#
+# Stage 1 is the bitset engine on slot-only domains (one pseudo-room, so a
+# domain is S bits).  Rooms become counting constraints: for every distinct
+# set of candidate rooms P, the sessions whose candidates all lie in P may
+# not outnumber |P| in any slot; once a slot is full for P, forward checking
+# removes it from the other such sessions.  Candidate rooms come from room
+# type and capacity, so within a type the sets are nested, and then these
+# counts are exactly the condition for every slot to have a matching, as
+# long as each session has the same rooms in every slot.
+#
+# Stage 2 runs Hopcroft-Karp per slot, in slot order.  A double period is
+# matched at its first slot and keeps that room for its second one.  The
+# counts take P as a session's rooms over all its slots, but propagation
+# prunes (slot, room) pairs, so its rooms can differ per slot and a slot can
+# still lack a full matching, with or without double periods.  Then the
+# engine falls back to the (slot, room) bitset search with whatever limits
+# are left.
+#
+# Slot-only domains hide how many rooms a slot has left, which the (slot,
+# room) engine's most-constrained-first choice sees for free; without it,
+# tight room instances thrash.  So stage 1 picks the session with the fewest
+# free (slot, room) pairs in its own room set: |P| per slot in its domain
+# minus the sessions already there, summed over bit-planes of the counts.
+
+
+class SlotCSP(BitsetCSP):
+    # BitsetCSP over slots, with per-slot room counting instead of room clashes
+    def __init__(self, variables, domains, rooms, slot_ids, value_order="lcv", seed=None, rules=None):
+        # domains: var -> ((slot, 0), ...); rooms: var -> frozenset of candidate rooms
+        super().__init__(variables, domains, slot_ids=slot_ids, value_order=value_order, seed=seed, rules=rules)
+        pools = list(dict.fromkeys(rooms[v] for v in self.variables))
+        self.cap = [len(p) for p in pools]
+        self.pools_of = [[j for j, p in enumerate(pools) if rooms[v] <= p] for v in self.variables]
+        self.members: List[List[int]] = [[] for _ in pools]
+        for i, js in enumerate(self.pools_of):
+            for j in js:
+                self.members[j].append(i)
+        self.own = [pools.index(rooms[v]) for v in self.variables]
+        self.used = [[0] * self.S for _ in pools]
+        # plane[j][b]: slots whose count used[j] has bit b set
+        self.plane = [[0] * c.bit_length() for c in self.cap]
+
+    def mrv(self) -> int:
+        def left(i):
+            dom, j = self.dom[i], self.own[i]
+            return self.cap[j] * dom.bit_count() - sum((dom & m).bit_count() << b for b, m in enumerate(self.plane[j]))
+        return min((i for i in range(len(self.variables)) if self.value[i] < 0), key=left)
+
+    def live(self):
+        # one pseudo-room: rbusy is not a clash here, the pools are
+        return -1, -1
+
+    def free(self, i) -> int:
+        busy = self.tbusy[self.teacher[i]] | self.cbusy[self.klass[i]]
+        if self.span[i] == 2:
+            busy |= busy >> 1
+        return self.dom[i] & ~busy
+
+    def place(self, i, vi):
+        super().place(i, vi)
+        for j in self.pools_of[i]:
+            planes = self.plane[j]
+            for x in range(vi, vi + self.span[i]):
+                self.used[j][x] += 1
+                bit = 1 << x
+                for b in range(len(planes)):  # binary increment
+                    planes[b] ^= bit
+                    if planes[b] & bit:
+                        break
+
+    def unplace(self, i, vi):
+        super().unplace(i, vi)
+        for j in self.pools_of[i]:
+            planes = self.plane[j]
+            for x in range(vi, vi + self.span[i]):
+                self.used[j][x] -= 1
+                bit = 1 << x
+                for b in range(len(planes)):  # binary decrement
+                    planes[b] ^= bit
+                    if not planes[b] & bit:
+                        break
+
+    def forward_check(self, i, vi, trail) -> bool:
+        if not super().forward_check(i, vi, trail):
+            return False
+        for j in self.pools_of[i]:
+            full = 0
+            for x in range(vi, vi + self.span[i]):
+                if self.used[j][x] >= self.cap[j]:
+                    full |= 1 << x
+            if not full:
+                continue
+            # starts that would need a room of P in a full slot
+            hit = (full, full | (full >> 1))
+            for u in self.members[j]:
+                if self.value[u] < 0:
+                    old = self.dom[u]
+                    new = old & ~hit[self.span[u] - 1]
+                    if new != old and not self.narrow(u, new, trail):
+                        return False
+        return True
+
+
+class TwoStage:
+    # Same interface as the other engines: backtrack(node_limit, deadline),
+    # stats(), best_partial(), stopped.
+    def __init__(self, variables, domains, slot_ids, value_order="lcv", seed=None, rules=None):
+        self.variables = list(variables)
+        self.domains = domains
+        self.slot_ids, self.value_order, self.seed, self.rules = list(slot_ids), value_order, seed, rules
+        # per domain object: the slots, and per slot the candidate rooms
+        slot_doms, self.rooms_at, rooms = {}, {}, {}
+        for v in self.variables:
+            vals = domains[v]
+            if id(vals) not in slot_doms:
+                at = {}
+                for sl, r in vals:
+                    at.setdefault(sl, []).append(r)
+                slot_doms[id(vals)] = tuple((sl, 0) for sl in at)
+                self.rooms_at[id(vals)] = at
+            rooms[v] = frozenset(r for _, r in vals)
+        self.stage1 = SlotCSP(self.variables, {v: slot_doms[id(domains[v])] for v in self.variables}, rooms,
+                              self.slot_ids, value_order, seed, rules)
+        self.fallback = None
+        self.stopped = False
+
+    @property
+    def nodes(self):
+        return self.stage1.nodes + (self.fallback.nodes if self.fallback else 0)
+
+    def stats(self) -> Dict[str, int]:
+        out = self.stage1.stats()
+        if self.fallback:
+            for key, value in self.fallback.stats().items():
+                out[key] = max(out[key], value) if key == "max_depth" else out[key] + value
+        return out
+
+    def backtrack(self, node_limit=None, deadline=None):
+        if self.fallback:
+            return self._fallback(node_limit, deadline)
+        slots = self.stage1.backtrack(node_limit, deadline)
+        self.stopped = self.stage1.stopped
+        if slots is None:
+            return None
+        assignment = self.assign_rooms(slots)
+        if len(assignment) == len(self.variables):
+            return assignment
+        # some slot's rooms could not seat all its sessions
+        self.fallback = BitsetCSP(self.variables, self.domains, slot_ids=self.slot_ids,
+                                  value_order=self.value_order, seed=self.seed, rules=self.rules)
+        if node_limit is not None:
+            node_limit = max(0, node_limit - self.stage1.nodes)
+        return self._fallback(node_limit, deadline)
+
+    def _fallback(self, node_limit, deadline):
+        result = self.fallback.backtrack(node_limit, deadline)
+        self.stopped = self.fallback.stopped
+        return result
+
+    def best_partial(self):
+        if self.fallback:
+            return self.fallback.best_partial()
+        return self.assign_rooms(self.stage1.best_partial())
+
+    def assign_rooms(self, slots) -> Dict[Tuple, Tuple[int, int]]:
+        # slots: var -> (slot, 0) -> var -> (slot, room) for every session the
+        # per-slot matchings could seat
+        cover = self.rules.cover if self.rules else (lambda v, sl: (sl,))
+        starting, held = {}, {}  # slot -> vars starting there / rooms kept by doubles started earlier
+        for v, (sl, _) in slots.items():
+            starting.setdefault(sl, []).append(v)
+        out = {}
+        for sl in self.slot_ids:
+            vs = starting.get(sl, [])
+            if not vs:
+                continue
+            blocked = held.get(sl, ())
+            adj = {v: [r for r in self.rooms_at[id(self.domains[v])][sl] if r not in blocked] for v in vs}
+            for v, r in hopcroft_karp(adj).items():
+                out[v] = (sl, r)
+                for x in cover(v, sl)[1:]:
+                    held.setdefault(x, set()).add(r)
+        return out
+
+
+def hopcroft_karp(adj) -> Dict[object, object]:
+    # maximum matching of a bipartite graph given as left -> [right, ...]
+    match_l, match_r = {}, {}
+    INF = float("inf")
+    while True:
+        # BFS layers from the free left vertices
+        dist, queue = {}, deque()
+        for u in adj:
+            if u not in match_l:
+                dist[u] = 0
+                queue.append(u)
+        found = False
+        while queue:
+            u = queue.popleft()
+            for r in adj[u]:
+                w = match_r.get(r)
+                if w is None:
+                    found = True
+                elif w not in dist:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            return match_l
+        # DFS along the layers for vertex-disjoint shortest augmenting paths
+        for root in [u for u in adj if u not in match_l]:
+            path, stack = [], [(root, iter(adj[root]))]
+            while stack:
+                u, it = stack[-1]
+                for r in it:
+                    w = match_r.get(r)
+                    if w is None:
+                        path.append((u, r))
+                        stack.clear()
+                        break
+                    if dist.get(w, INF) == dist[u] + 1:
+                        path.append((u, r))
+                        stack.append((w, iter(adj[w])))
+                        break
+                else:
+                    stack.pop()
+                    dist[u] = INF  # dead end for this phase
+                    if path:
+                        path.pop()
+                    continue
+                if not stack:
+                    for u2, r2 in path:
+                        match_l[u2], match_r[r2] = r2, u2
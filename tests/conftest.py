@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+# a throwaway SQLite database, set before db.py builds its engine
+os.environ["DB_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from bench.generate import generate, load_instance
+from db import get_session, init_db
+from solver.build_problem import Rules, build_domains, build_variables, load_context
+from solver.propagate import reduce
+
+# small enough for every engine, with the rules that make it hard: double
+# periods, a lunch break and a daily cap on every teacher
+SMALL = dict(classes=4, teachers=5, rooms=3, labs=1, days=4, periods=6, density=0.6, lab_hours=2)
+
+
+@pytest.fixture(params=[0, 1, 2])
+def problem(request):
+    """(ctx, variables, domains, rules) of a reduced instance per generator seed."""
+    instance = generate(seed=request.param, **SMALL)
+    for sub in instance["subjects"]:
+        sub.allow_double_period = sub.type == "lab" or sub.id % 3 == 0
+    for t in instance["timeslots"]:
+        t.is_lunch = t.slot_index == 3
+    for t in instance["teachers"]:
+        t.max_daily_load = 4
+    init_db()
+    with get_session() as s:
+        load_instance(s, instance)
+        s.commit()
+    ctx = load_context()
+    variables = build_variables(ctx)
+    rules = Rules(ctx)
+    domains, _ = reduce(variables, build_domains(ctx, variables), rules)
+    assert domains is not None and any(rules.span(v) == 2 for v in variables)
+    return ctx, variables, domains, rules
@@ -0,0 +1,40 @@
+import pytest
+
+from solver.bitset import _bits
+from solver.pipeline import make_csp
+
+
+def knocked_out(csp, i):
+    """For each free value of i, count the live values of other unassigned
+    sessions it rules out, one value at a time."""
+    S, live, span = csp.S, csp.live(), csp.span[i]
+    counts = {}
+    for vi in _bits(csp.free(i)):
+        s, r = vi % S, vi // S
+        n = 0
+        for u in range(len(csp.variables)):
+            if u == i or csp.value[u] >= 0:
+                continue
+            for ui in _bits(csp.dom[u] & live[csp.span[u] - 1]):
+                s2, r2 = ui % S, ui // S
+                overlap = s < s2 + csp.span[u] and s2 < s + span
+                if csp.mapping[u] == csp.mapping[i]:
+                    # siblings keep their order of periods as well
+                    n += overlap or (csp.k[u] > csp.k[i]) != (s2 > s)
+                elif csp.teacher[u] == csp.teacher[i] or csp.klass[u] == csp.klass[i]:
+                    n += overlap
+                else:
+                    n += overlap and r == r2
+        counts[vi] = n
+    return counts
+
+
+@pytest.mark.parametrize("limit", [1, 7, 20, 45])
+def test_lcv_order_matches_brute_force(problem, limit):
+    ctx, variables, domains, _ = problem
+    csp = make_csp("bitset", "lcv", ctx, variables, domains)
+    csp.backtrack(node_limit=limit)
+    for i in range(len(variables)):
+        if csp.value[i] < 0:
+            counts = knocked_out(csp, i)
+            assert csp.order(i) == sorted(counts, key=lambda vi: (counts[vi], csp.tiebreak[vi]))
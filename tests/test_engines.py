@@ -0,0 +1,144 @@
+import itertools
+import random
+
+import pytest
+
+from solver.bitset import _bits
+from solver.build_problem import build_domains, consistent_factory
+from solver.pipeline import make_csp
+from solver.repair import min_conflicts
+from solver.twostage import TwoStage
+
+
+def assert_valid(ctx, rules, variables, domains, assignment):
+    # every session placed, within its domain, without a clash or a teacher
+    # past the daily limit
+    assert assignment is not None and set(assignment) == set(variables)
+    for v in variables:
+        assert assignment[v] in domains[v], v
+    consistent = consistent_factory(ctx)
+    for v, u in itertools.combinations(variables, 2):
+        assert consistent(v, assignment[v], u, assignment[u]), (v, assignment[v], u, assignment[u])
+    used = {}
+    for v in variables:
+        for key, periods, cap in rules.load(v, assignment[v]):
+            used[key] = used.get(key, 0) + periods
+            assert used[key] <= cap, key
+
+
+@pytest.mark.parametrize("engine", ["bitset", "twostage", "classic"])
+@pytest.mark.parametrize("seed", [None, 1])
+def test_engine_finds_valid_timetable(problem, engine, seed):
+    ctx, variables, domains, rules = problem
+    csp = make_csp(engine, "lcv", ctx, variables, domains, seed=seed)
+    assert_valid(ctx, rules, variables, domains, csp.backtrack(node_limit=20000))
+
+
+def test_propagation_keeps_every_solution(problem):
+    # reduce() only removes values that are in no timetable: one found on the
+    # unreduced domains survives it
+    ctx, variables, domains, rules = problem
+    full = build_domains(ctx, variables)
+    assignment = make_csp("bitset", "lcv", ctx, variables, full).backtrack(node_limit=20000)
+    assert_valid(ctx, rules, variables, full, assignment)
+    for v in variables:
+        assert assignment[v] in domains[v], v
+
+
+def test_twostage_matches_rooms_per_slot(problem):
+    ctx, variables, domains, rules = problem
+    csp = make_csp("twostage", "lcv", ctx, variables, domains)
+    assert_valid(ctx, rules, variables, domains, csp.backtrack(node_limit=20000))
+    assert csp.fallback is None
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_min_conflicts_repairs_timetable(problem, seed):
+    # a valid timetable with some sessions dropped and others moved
+    ctx, variables, domains, rules = problem
+    rnd = random.Random(seed)
+    start = make_csp("bitset", "none", ctx, variables, domains).backtrack(node_limit=20000)
+    for v in rnd.sample(variables, len(variables) // 3):
+        del start[v]
+    for v in rnd.sample(list(start), len(start) // 4):
+        start[v] = rnd.choice(domains[v])
+    assignment, _ = min_conflicts(variables, domains, start, [t.id for t in ctx["slot_list"]], seed=seed,
+                                      rules=rules)
+    assert_valid(ctx, rules, variables, domains, assignment)
+
+
+def recount(csp):
+    # the bitset engine's counters, from the values and domains alone
+    S = csp.S
+    busy = {"tbusy": {t: 0 for t in csp.tbusy}, "cbusy": {c: 0 for c in csp.cbusy}, "rbusy": 0,
+            "tday": {t: [0] * len(days) for t, days in csp.tday.items()}}
+    support = ({}, {})
+    for i, vi in enumerate(csp.value):
+        if vi < 0:
+            for ui in _bits(csp.dom[i]):
+                support[csp.span[i] - 1][ui] = support[csp.span[i] - 1].get(ui, 0) + 1
+            continue
+        occ = csp.occ(i, vi)
+        busy["tbusy"][csp.teacher[i]] |= occ
+        busy["cbusy"][csp.klass[i]] |= occ
+        busy["rbusy"] |= occ << (vi - vi % S)
+        busy["tday"][csp.teacher[i]][csp.day[vi % S]] += csp.span[i]
+    return busy, support
+
+
+def counters(csp):
+    busy = {"tbusy": dict(csp.tbusy), "cbusy": dict(csp.cbusy), "rbusy": csp.rbusy,
+            "tday": {t: list(days) for t, days in csp.tday.items()}}
+    support = ({}, {})
+    for counts, planes in zip(support, csp.rplane):
+        for b, plane in enumerate(planes):
+            for ui in _bits(plane):
+                counts[ui] = counts.get(ui, 0) + (1 << b)
+    return busy, support
+
+
+def pool_recount(csp):
+    # the slot engine's per-pool room counts, from the values alone
+    used = [[0] * csp.S for _ in csp.cap]
+    for i, vi in enumerate(csp.value):
+        if vi >= 0:
+            for j in csp.pools_of[i]:
+                for x in range(vi, vi + csp.span[i]):
+                    used[j][x] += 1
+    planes = [[sum(((n >> b) & 1) << x for x, n in enumerate(row)) for b in range(len(p))]
+              for row, p in zip(used, csp.plane)]
+    return used, planes
+
+
+@pytest.mark.parametrize("engine", ["bitset", "twostage"])
+@pytest.mark.parametrize("limit", [5, 20])
+def test_counters_match_recount(problem, engine, limit):
+    # place and take back values in the middle of a search
+    ctx, variables, domains, _ = problem
+    top = make_csp(engine, "lcv", ctx, variables, domains)
+    csp = top.stage1 if isinstance(top, TwoStage) else top
+    csp.backtrack(node_limit=limit)
+
+    def check():
+        busy, support = counters(csp)
+        expected, expected_support = recount(csp)
+        if engine == "twostage":
+            # one pseudo-room: the slot engine keeps rooms in its pools
+            del busy["rbusy"], expected["rbusy"]
+            assert (csp.used, csp.plane) == pool_recount(csp)
+        assert (busy, support) == (expected, expected_support)
+
+    check()
+    rnd = random.Random(limit)
+    unassigned = [i for i, vi in enumerate(csp.value) if vi < 0]
+    for i in rnd.sample(unassigned, min(5, len(unassigned))):
+        vals = _bits(csp.free(i))
+        if not vals:
+            continue
+        vi, trail = rnd.choice(vals), []
+        csp.place(i, vi)
+        csp.forward_check(i, vi, trail)
+        check()
+        csp.undo(trail, 0)
+        csp.unplace(i, vi)
+        check()
@@ -0,0 +1,55 @@
+import pytest
+
+from db import init_db, get_session
+from bench.generate import PRESETS, generate, load_instance
+from solver.pipeline import activate_timetable, list_timetables, save_result, solve_problem
+
+# the parts of a solve result that must not depend on a cache hit
+SAME = ("status", "assignment", "doubles", "variables", "fingerprint", "reason")
+
+
+def load(instance):
+    init_db()
+    with get_session() as s:
+        load_instance(s, instance)
+        s.commit()
+
+
+@pytest.mark.parametrize("infeasible", [False, True])
+def test_cached_solve_matches_first_solve(infeasible):
+    instance = generate(seed=0, **PRESETS["small"])
+    if infeasible:
+        # more periods than the class has slots: propagation proves it
+        instance["maps"][0].required_hours = len(instance["timeslots"]) + 1
+    load(instance)
+    first = solve_problem()
+    second = solve_problem()
+    assert first["status"] == ("infeasible" if infeasible else "feasible")
+    assert second["cache"]["solution"]
+    assert {k: first.get(k) for k in SAME} == {k: second.get(k) for k in SAME}
+    assert ("reason" in first) == ("reason" in second)
+
+
+def test_partial_timetable_does_not_replace_complete_one():
+    load(generate(seed=0, **PRESETS["small"]))
+    result = solve_problem()
+    complete = save_result(dict(result))["timetable_id"]
+    partial = dict(result, status="partial", fingerprint=None,
+                   assignment=dict(list(result["assignment"].items())[:10]))
+    saved = save_result(dict(partial))
+    assert not saved["active"]
+    assert {tt.id: tt.is_active for tt in list_timetables()} == {complete: True, saved["timetable_id"]: False}
+    assert activate_timetable(saved["timetable_id"])
+    # a partial one does replace an active partial one
+    again = save_result(dict(partial))
+    assert again["active"]
+    assert [tt.id for tt in list_timetables() if tt.is_active] == [again["timetable_id"]]
+
+
+def test_unseeded_portfolio_is_not_cached():
+    # its seeds are drawn at random, so the options do not decide its timetable
+    load(generate(seed=0, **PRESETS["small"]))
+    first = solve_problem(portfolio=2)
+    second = solve_problem(portfolio=2)
+    assert first["status"] == second["status"] == "feasible"
+    assert first["fingerprint"] is None and not second["cache"]["solution"]